@@ -45,58 +45,61 @@ def run_benchmark():
     print(f"\n🚀 DÉBUT DU BENCHMARK SCIENTIFIQUE ({len(LUXURY_BENCHMARK)} produits)")
     print("=" * 80)
 
-    latencies = []
-    reciprocal_ranks = []
-    hits = 0
+    # Tableaux préalloués, remplis par index (pas de croissance de listes Python)
+    latencies = np.empty(len(LUXURY_BENCHMARK), dtype=np.float64)
+    reciprocal_ranks = np.zeros_like(latencies)
 
-    for product in LUXURY_BENCHMARK:
+    # Préchauffage (init CUDA/JIT, caches) : hors mesure pour ne pas fausser la latence
+    engine.find_similar_products(target_ingredients="water, glycerin", secondary="serum", top_n=5)
+
+    # Encodage de toutes les requêtes en une seule passe du transformer
+    encode_start = time.perf_counter()
+    query_embs = engine.encode_batch([p['ingredients'] for p in LUXURY_BENCHMARK])
+    encode_ms = (time.perf_counter() - encode_start) * 1000
+    print(f"🧪 Encodage groupé : {encode_ms:.2f} ms ({encode_ms / len(LUXURY_BENCHMARK):.2f} ms/requête)")
+
+    for i, (product, query_emb) in enumerate(zip(LUXURY_BENCHMARK, query_embs)):
         print(f"\n💎 Cible : {product['name']} ({product['price']}$)")
         
-        # 1. Mesure de la Latence
+        # 1. Mesure de la Latence (recherche seule, encodage amorti ci-dessus)
         start_time = time.perf_counter()
-        results = engine.find_similar_products(
-            target_ingredients=product['ingredients'],
+        hits_arr = engine.find_similar_arrays(
+            query_emb,
             secondary=product['category'],
             top_n=20 # On regarde le top 20 pour calculer le MRR
         )
         end_time = time.perf_counter()
-        latency_ms = (end_time - start_time) * 1000
-        latencies.append(latency_ms)
+        latencies[i] = (end_time - start_time) * 1000
 
-        # 2. Recherche du premier "Vrai Dupe"
+        # 2. Recherche du premier "Vrai Dupe" (masque NumPy sur le Top 20)
         # Critères : Similarité > 70% ET Prix < 80% du prix cible
-        first_valid_rank = 0
-        found_dupe = None
-        
-        for i, res in enumerate(results, 1):
-            is_cheaper = res['price'] > 0 and res['price'] < (product['price'] * 0.8)
-            is_similar = res['similarity'] > 0.70
-            
-            if is_cheaper and is_similar:
-                first_valid_rank = i
-                found_dupe = res
-                break # On a trouvé le premier (le mieux classé)
+        sim_arr, price_arr = hits_arr['similarity'], hits_arr['price']
+        mask = (price_arr > 0) & (price_arr < product['price'] * 0.8) & (sim_arr > 0.70)
+        rank_positions = np.flatnonzero(mask)
+        first_valid_rank = int(rank_positions[0]) + 1 if rank_positions.size else 0
         
         # 3. Calcul des scores pour ce produit
         if first_valid_rank > 0:
-            hits += 1
             rr = 1.0 / first_valid_rank
-            reciprocal_ranks.append(rr)
-            print(f"   ✅ Dupe trouvé au rang #{first_valid_rank} : {found_dupe['brand_name']} ({found_dupe['price']}$)")
+            reciprocal_ranks[i] = rr
+            pos = rank_positions[0]
+            found_dupe = engine.products_df_indexed.iloc[hits_arr['row_idx'][pos]]
+            print(f"   ✅ Dupe trouvé au rang #{first_valid_rank} : {found_dupe['brand_name']} ({price_arr[pos]:.1f}$)")
             print(f"      Score MRR : {rr:.2f}")
         else:
-            reciprocal_ranks.append(0.0)
             print("   ❌ Aucun dupe économique valide trouvé dans le Top 20.")
 
     # --- CALCUL DES MÉTRIQUES GLOBALES ---
-    avg_latency = np.mean(latencies)
-    mrr_score = np.mean(reciprocal_ranks)
-    accuracy = (hits / len(LUXURY_BENCHMARK)) * 100
+    avg_latency = latencies.mean()
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    mrr_score = reciprocal_ranks.mean()
+    accuracy = 100.0 * np.count_nonzero(reciprocal_ranks) / reciprocal_ranks.size
 
     print("\n" + "="*80)
     print("📊 RAPPORT DE PERFORMANCE FINAL")
     print("="*80)
-    print(f"⚡ Latence Moyenne : {avg_latency:.2f} ms")
+    print(f"⚡ Latence Moyenne : {avg_latency:.2f} ms (+ {encode_ms / len(LUXURY_BENCHMARK):.2f} ms d'encodage amorti)")
+    print(f"   P50 / P95 / P99 : {p50:.2f} / {p95:.2f} / {p99:.2f} ms")
     print("-" * 40)
     print(f"🎯 Accuracy (Hit Rate) : {accuracy:.1f}%")
     print("   (Pourcentage de produits chers pour lesquels on trouve une alternative)")
@@ -1,5 +1,6 @@
 from nlp_engine import PureSkinNLPEngine
 import pandas as pd
+import numpy as np
 import re
 import logging
 
@@ -10,6 +11,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Seuils de qualité de match (triés) et libellés associés, pour np.searchsorted
+THRESHOLDS = np.array([0.4, 0.6, 0.8])
+LABELS = np.array(["FAIBLE", "MODÉRÉ", "BON", "EXCELLENT"])
+
 def debug_engine_loading():
     """Teste le chargement du moteur"""
     
@@ -54,9 +59,9 @@ def debug_product_search(engine, brand_pattern="Revolution", product_pattern="Ni
     
     df = engine.products_df_indexed
     
-    # Recherche insensible à la casse
-    brand_mask = df['brand_name'].astype(str).str.contains(brand_pattern, case=False, na=False)
-    product_mask = df['product_name'].astype(str).str.contains(product_pattern, case=False, na=False)
+    # Recherche insensible à la casse (colonnes minuscules précalculées, sans regex)
+    brand_mask = df['_brand_lower'].str.contains(brand_pattern.lower(), regex=False, na=False)
+    product_mask = df['_product_lower'].str.contains(product_pattern.lower(), regex=False, na=False)
     
     matches = df[brand_mask & product_mask]
     
@@ -70,37 +75,37 @@ def debug_product_search(engine, brand_pattern="Revolution", product_pattern="Ni
         
         if not brand_only.empty:
             print(f"📦 Produits de la marque '{brand_pattern}':")
-            for _, row in brand_only.head(5).iterrows():
-                print(f"   - '{row['product_name']}' (Cat: {row.get('secondary_category', 'N/A')})")
+            for row in brand_only.head(5).itertuples(index=False):
+                print(f"   - '{row.product_name}' (Cat: {getattr(row, 'secondary_category', 'N/A')})")
         
         if not product_only.empty:
             print(f"\n📦 Produits contenant '{product_pattern}':")
-            for _, row in product_only.head(5).iterrows():
-                print(f"   - {row['brand_name']}: '{row['product_name']}' (Cat: {row.get('secondary_category', 'N/A')})")
+            for row in product_only.head(5).itertuples(index=False):
+                print(f"   - {row.brand_name}: '{row.product_name}' (Cat: {getattr(row, 'secondary_category', 'N/A')})")
         
         # Suggestions de marques similaires
         print(f"\n💡 Suggestions de marques:")
-        all_brands = df['brand_name'].astype(str).unique()
-        similar_brands = [b for b in all_brands if brand_pattern.lower() in b.lower()]
+        # Même masque que la recherche marque : pas de re-scan Python des marques
+        similar_brands = df.loc[brand_mask, 'brand_name'].drop_duplicates().head(5).tolist()
         if similar_brands:
-            for brand in similar_brands[:5]:
+            for brand in similar_brands:
                 print(f"   - {brand}")
     else:
         print(f"✅ {len(matches)} produit(s) trouvé(s):")
-        for idx, (_, row) in enumerate(matches.iterrows(), 1):
-            print(f"\n{idx}. {row['brand_name']} - {row['product_name']}")
-            print(f"   Catégorie: {row.get('primary_category', 'N/A')} > {row.get('secondary_category', 'N/A')}")
-            print(f"   Prix: ${row.get('price_usd', 'N/A')}")
-            print(f"   Rating: {row.get('rating', 'N/A')} ({row.get('reviews', 0)} avis)")
+        for idx, row in enumerate(matches.itertuples(index=False), 1):
+            print(f"\n{idx}. {row.brand_name} - {row.product_name}")
+            print(f"   Catégorie: {getattr(row, 'primary_category', 'N/A')} > {getattr(row, 'secondary_category', 'N/A')}")
+            print(f"   Prix: ${getattr(row, 'price_usd', 'N/A')}")
+            print(f"   Rating: {getattr(row, 'rating', 'N/A')} ({getattr(row, 'reviews', 0)} avis)")
             
             # Afficher un aperçu des ingrédients
-            ingredients = str(row.get('ingredients', ''))
+            ingredients = str(getattr(row, 'ingredients', ''))
             if len(ingredients) > 100:
                 ingredients = ingredients[:100] + "..."
             print(f"   Ingrédients: {ingredients}")
 
-def debug_vector_search(engine, query_ingredients, category="serum"):
-    """Teste la recherche vectorielle"""
+def debug_vector_search(engine, query_ingredients, category="serum", pq=None):
+    """Teste la recherche vectorielle (pq : requête déjà préparée, cf. engine.prepare_query)"""
     
     print(f"\n" + "="*50)
     print(f"🧪 DEBUG - RECHERCHE VECTORIELLE")
@@ -115,39 +120,31 @@ def debug_vector_search(engine, query_ingredients, category="serum"):
     
     # Recherche
     try:
-        results = engine.find_similar_products(
-            target_ingredients=query_ingredients,
-            secondary=category,
-            top_n=10
-        )
+        hits_before, misses_before = engine.cache_hits, engine.cache_misses
+        if pq is None:
+            pq = engine.prepare_query(query_ingredients)
+        results = engine.search_prepared(pq, secondary=category, top_n=10)
         
         if not results:
             print("❌ Aucun résultat trouvé")
-            # Essayer sans filtre de catégorie
+            # Essayer sans filtre de catégorie (même requête préparée, pas de ré-encodage)
             print("\n🔍 Essai sans filtre de catégorie...")
-            results = engine.find_similar_products(
-                target_ingredients=query_ingredients,
-                secondary=None,
-                top_n=10
-            )
+            results = engine.search_prepared(pq, secondary=None, top_n=10)
         
+        print(f"🗃️  Cache requêtes: {engine.cache_hits - hits_before} hit(s), "
+              f"{engine.cache_misses - misses_before} miss(es)")
+
         if results:
             print(f"✅ {len(results)} résultat(s) trouvé(s):")
-            for i, r in enumerate(results, 1):
+            # Classement de toutes les similarités en un seul appel vectorisé
+            sims = np.fromiter((r['similarity'] for r in results), dtype=np.float32, count=len(results))
+            labels = LABELS[np.searchsorted(THRESHOLDS, sims)]
+            for i, (r, match_quality) in enumerate(zip(results, labels), 1):
                 print(f"\n{i}. [{r['similarity']:.3f}] {r['brand_name']} - {r['product_name']}")
                 print(f"   💰 Prix: ${r['price']:.2f}")
                 print(f"   ⭐ Rating: {r.get('rating', 'N/A')}")
                 print(f"   📁 Catégorie: {r.get('secondary_category', 'N/A')}")
                 
-                # Identifier si c'est un bon match
-                if r['similarity'] > 0.8:
-                    match_quality = "EXCELLENT"
-                elif r['similarity'] > 0.6:
-                    match_quality = "BON"
-                elif r['similarity'] > 0.4:
-                    match_quality = "MODÉRÉ"
-                else:
-                    match_quality = "FAIBLE"
                 print(f"   🎯 Qualité match: {match_quality}")
         else:
             print("❌ Aucun résultat même sans filtre")
@@ -169,7 +166,13 @@ def debug_embeddings_analysis(engine):
     print(f"📐 Dimensions embeddings: {engine.product_embeddings.shape}")
     print(f"   - Produits: {engine.product_embeddings.shape[0]}")
     print(f"   - Dimensions: {engine.product_embeddings.shape[1]}")
-    
+
+    # Le balayage SIMD exige une matrice FP32 contiguë
+    unit = engine.product_embeddings_unit
+    assert unit.dtype == np.float32, f"dtype inattendu: {unit.dtype}"
+    assert unit.flags['C_CONTIGUOUS'], "matrice d'embeddings non contiguë"
+    print(f"   - Index de recherche: {unit.dtype}, C-contigu")
+
     # Aperçu des premiers embeddings
     print(f"\n👀 Aperçu embeddings (3 premiers produits):")
     for i in range(min(3, len(engine.products_df_indexed))):
@@ -194,7 +197,8 @@ def main():
     
     # 3. Recherche vectorielle
     query = "Aqua, Niacinamide, Pentylene Glycol, Zinc PCA, Dimethyl Isosorbide"
-    debug_vector_search(engine, query, "serum")
+    pq = engine.prepare_query(query)
+    debug_vector_search(engine, query, "serum", pq=pq)
     
     # 4. Analyse des embeddings
     debug_embeddings_analysis(engine)
@@ -211,12 +215,26 @@ def main():
         "Water, Salicylic Acid, Witch Hazel"
     ]
     
-    for i, query in enumerate(test_queries, 1):
+    # Préchauffage : les latences affichées reflètent le régime établi
+    engine.find_similar_products(target_ingredients="water, glycerin", secondary="serum", top_n=5)
+
+    start = time.perf_counter()
+    query_embs = engine.encode_batch(test_queries)
+    encode_ms = (time.perf_counter() - start) * 1000
+    print(f"Encodage groupé ({len(test_queries)} requêtes): {encode_ms:.2f} ms")
+
+    for i, (query, query_emb) in enumerate(zip(test_queries, query_embs), 1):
         start = time.perf_counter()
-        results = engine.find_similar_products(query, top_n=5)
+        results = engine.find_similar_by_embedding(query_emb, top_n=5)
         duration = (time.perf_counter() - start) * 1000
         
         print(f"Query {i} ({len(query)} chars): {duration:.2f} ms, {len(results)} résultats")
+
+    # Requête principale réutilisée telle quelle : ni encodage ni normalisation
+    start = time.perf_counter()
+    results = engine.search_prepared(pq, secondary="serum", top_n=10)
+    duration = (time.perf_counter() - start) * 1000
+    print(f"Requête préparée (réutilisée): {duration:.2f} ms, {len(results)} résultats")
     
     print(f"\n✨ Debug terminé avec succès!")
     print("💡 Prochaines étapes:")
@@ -1,5 +1,6 @@
 from nlp_engine import PureSkinNLPEngine
 import pandas as pd
+import numpy as np
 
 # 1. Chargement du moteur
 print("⏳ Chargement du cerveau IA...")
@@ -32,41 +33,40 @@ expensive_targets = [
 print(f"\n🚀 RECHERCHE DE DUPES ÉCONOMIQUES")
 print("=" * 60)
 
-for target in expensive_targets:
+# Encodage de toutes les cibles en une seule passe du transformer
+target_embs = engine.encode_batch([t['ingredients'] for t in expensive_targets])
+
+for target, target_emb in zip(expensive_targets, target_embs):
     print(f"\n💎 CIBLE : {target['name']}")
     print(f"   🧪 Ingrédients clés : {target['ingredients'][:60]}...")
     
     # Recherche dans TA base de données
-    results = engine.find_similar_products(
-        target_ingredients=target['ingredients'],
+    hits = engine.find_similar_arrays(
+        target_emb,
         secondary=target['category'],
         top_n=10  # On cherche large pour trouver le moins cher
     )
-    
-    found_dupe = False
-    best_deal = None
+    sims, prices, rows = hits['similarity'], hits['price'], hits['row_idx']
     
     # Filtrage intelligent : On cherche haute similarité ET bas prix
-    for res in results:
-        # Critères du DUPE PARFAIT :
-        # 1. Similarité chimique > 70% (C'est la même chose)
-        # 2. Prix nettement inférieur (au moins 30% moins cher)
-        if res['similarity'] > 0.70 and res['price'] < (target['price'] * 0.7):
-            
-            saving = target['price'] - res['price']
-            print(f"   ✅ DUPE TROUVÉ : {res['brand_name']} - {res['product_name']}")
-            print(f"      💰 Prix : {res['price']}$ (Économie: -{saving:.0f}$ !)")
-            print(f"      🧪 Similarité : {res['similarity']*100:.1f}%")
-            found_dupe = True
-            
-            # On s'arrête au premier bon dupe trouvé (souvent le meilleur ranké)
-            break
-            
-    if not found_dupe:
+    # Critères du DUPE PARFAIT :
+    # 1. Similarité chimique > 70% (C'est la même chose)
+    # 2. Prix nettement inférieur (au moins 30% moins cher)
+    dupe_positions = np.flatnonzero((sims > 0.70) & (prices < target['price'] * 0.7))
+    
+    if dupe_positions.size:
+        # On prend le premier bon dupe trouvé (souvent le meilleur ranké)
+        pos = dupe_positions[0]
+        res = engine.products_df_indexed.iloc[rows[pos]]
+        saving = target['price'] - prices[pos]
+        print(f"   ✅ DUPE TROUVÉ : {res['brand_name']} - {res['product_name']}")
+        print(f"      💰 Prix : {prices[pos]:.2f}$ (Économie: -{saving:.0f}$ !)")
+        print(f"      🧪 Similarité : {sims[pos]*100:.1f}%")
+    else:
         # Si on a pas trouvé de "Vrai" dupe, on montre juste le plus proche chimiquement
-        best = results[0]
+        best = engine.products_df_indexed.iloc[rows[0]]
         print(f"   ⚠️ Pas de dupe 'parfait' bon marché trouvé.")
-        print(f"      Le plus proche chimiquement est : {best['brand_name']} ({best['price']}$)")
-        print(f"      Similarité : {best['similarity']*100:.1f}%")
+        print(f"      Le plus proche chimiquement est : {best['brand_name']} ({prices[0]:.2f}$)")
+        print(f"      Similarité : {sims[0]*100:.1f}%")
 
 print("\n" + "="*60)
\ No newline at end of file
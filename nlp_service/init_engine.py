@@ -1,17 +1,180 @@
 import pandas as pd
+import hashlib
 import logging
-from nlp_engine import PureSkinNLPEngine
+import os
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+    STRING_DTYPE = 'string[pyarrow]'  # Buffers UTF-8 contigus, kernels Arrow
+except ImportError:
+    PYARROW_AVAILABLE = False
+    STRING_DTYPE = 'string'
+
+# Toutes les colonnes du catalogue : l'API renvoie les lignes telles quelles
+# (/analyze/recommend, /analyze/dupes), aucune ne doit disparaître au chargement.
+# Les colonnes non typées ci-dessous sont laissées à l'inférence du lecteur
+CSV_COLUMNS = ['product_id', 'product_name', 'brand_name', 'price_usd', 'size', 'rating',
+               'reviews', 'loves_count', 'ingredients', 'highlights', 'primary_category',
+               'secondary_category', 'tertiary_category', 'new', 'out_of_stock', 'rating_group']
+# ~300 marques pour ~8 500 lignes : le type category déduplique les chaînes
+CSV_DTYPES = {'brand_name': 'category', 'price_usd': 'float32',
+              'rating': 'float32', 'reviews': 'float32'}
+# Colonnes texte nettoyées (manquants -> '', strip) sur les chaînes Arrow, sans objets Python
+TEXT_COLUMNS = ['product_id', 'product_name', 'ingredients']
+CSV_DTYPES.update({col: STRING_DTYPE for col in TEXT_COLUMNS})
+
+# À incrémenter quand la préparation (nettoyage, types) change sans toucher aux constantes
+CACHE_VERSION = 1
+# Clé de schéma écrite dans les métadonnées Arrow/Parquet : un cache produit avec
+# d'autres colonnes, types ou une autre préparation est reconstruit, pas relu
+CACHE_SCHEMA_KEY = hashlib.blake2b(
+    repr((CACHE_VERSION, CSV_COLUMNS, sorted(CSV_DTYPES.items()), TEXT_COLUMNS)).encode(),
+    digest_size=8).hexdigest().encode()
+CACHE_META_FIELD = b'pureskin_schema'
+
+def _arrow_column_types() -> dict:
+    """Équivalent Arrow de CSV_DTYPES (dictionary -> Categorical à la conversion pandas)."""
+    types = {col: pa.float32() for col in ('price_usd', 'rating', 'reviews')}
+    types.update({col: pa.string() for col in TEXT_COLUMNS + ['highlights']})
+    types['brand_name'] = pa.dictionary(pa.int32(), pa.string())
+    return types
+
+def _clean_text_column(column):
+    """Manquants -> '' puis suppression des espaces en bordure (kernels Arrow)."""
+    return pc.utf8_trim_whitespace(pc.fill_null(column, ''))
+
+def _read_products_table(csv_path: str) -> 'pa.Table':
+    """Lecture Arrow du CSV : types appliqués au parsing, colonnes texte nettoyées."""
+    # Lecteur Arrow multi-thread : les types sont appliqués au parsing, chaînes sans copie
+    table = pacsv.read_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(use_threads=True),
+        convert_options=pacsv.ConvertOptions(include_columns=CSV_COLUMNS,
+                                             column_types=_arrow_column_types()),
+    )
+    # Valeurs manquantes -> '' puis strip, en kernels Arrow avant la conversion pandas.
+    # Les kernels libèrent le GIL : une colonne par thread
+    with ThreadPoolExecutor(max_workers=len(TEXT_COLUMNS)) as ex:
+        cleaned = list(ex.map(_clean_text_column, (table[col] for col in TEXT_COLUMNS)))
+    for col, column in zip(TEXT_COLUMNS, cleaned):
+        table = table.set_column(table.schema.get_field_index(col), col, column)
+    return table
+
+def _table_to_pandas(table: 'pa.Table') -> pd.DataFrame:
+    """Conversion pandas : chaînes en string[pyarrow] (sans copie), dictionary -> Categorical."""
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+
+def read_products(csv_path: str) -> pd.DataFrame:
+    """Lit le CSV produits avec colonnes et types explicites (moins de parsing, moins de RAM)."""
+    if PYARROW_AVAILABLE:
+        return _table_to_pandas(_read_products_table(csv_path))
+
+    df = pd.read_csv(csv_path, usecols=CSV_COLUMNS, dtype=CSV_DTYPES)
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].fillna('').str.strip()
+    return df
+
+def _write_atomically(path: Path, write) -> None:
+    """write(tmp) dans un fichier temporaire du même dossier, puis os.replace vers path.
+
+    Plusieurs workers peuvent générer le même cache : aucun ne lit un fichier partiel.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def _with_schema_key(table: 'pa.Table') -> 'pa.Table':
+    """Ajoute CACHE_SCHEMA_KEY aux métadonnées du schéma (celles de pandas sont conservées)."""
+    metadata = dict(table.schema.metadata or {})
+    metadata[CACHE_META_FIELD] = CACHE_SCHEMA_KEY
+    return table.replace_schema_metadata(metadata)
+
+def _cache_is_fresh(cache_path: Path, csv_path: Path, read_schema) -> bool:
+    """Cache plus récent que le CSV et écrit avec la même clé de schéma."""
+    if not cache_path.exists() or cache_path.stat().st_mtime <= csv_path.stat().st_mtime:
+        return False
+    try:
+        metadata = read_schema(cache_path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return False
+    return metadata.get(CACHE_META_FIELD) == CACHE_SCHEMA_KEY
+
+def _ensure_feather(csv_path: Path) -> Path:
+    """Convertit le CSV en Arrow IPC (Feather v2) au premier appel, si le CSV ou le schéma a changé."""
+    arrow_path = csv_path.with_suffix('.arrow')
+    if not _cache_is_fresh(arrow_path, csv_path, lambda p: pa.ipc.open_file(p).schema):
+        # Non compressé : la lecture memory-mappée reste sans copie ni décompression
+        table = _with_schema_key(_read_products_table(csv_path))
+        _write_atomically(arrow_path, lambda tmp: feather.write_feather(table, tmp, compression='uncompressed'))
+        logger.info(f"📦 Catalogue converti en Arrow IPC : {arrow_path}")
+    return arrow_path
+
+def read_products_mmap(csv_path: str) -> pd.DataFrame:
+    """Comme read_products, mais depuis une copie Arrow IPC memory-mappée (démarrage API)."""
+    csv_path = Path(csv_path)
+    if not PYARROW_AVAILABLE:
+        return read_products(csv_path)
+    table = feather.read_table(_ensure_feather(csv_path), memory_map=True)
+    return _table_to_pandas(table)
+
+# Frame nettoyée et typée, réutilisée si la vectorisation doit être relancée
+PREPARED_CACHE = Path('product_info_prepared.parquet')
+
+def load_prepared(csv_path: str) -> pd.DataFrame:
+    """read_products avec cache Parquet (zstd), invalidé si le CSV est plus récent ou le schéma différent."""
+    csv_path = Path(csv_path)
+    if PYARROW_AVAILABLE and _cache_is_fresh(PREPARED_CACHE, csv_path, pq.read_schema):
+        logger.info(f"📦 Dataset préparé relu depuis {PREPARED_CACHE}")
+        return pd.read_parquet(PREPARED_CACHE)
+
+    df = read_products(csv_path)
+    if PYARROW_AVAILABLE:
+        # Catégories (dictionary) et chaînes Arrow survivent à l'aller-retour Parquet
+        table = _with_schema_key(pa.Table.from_pandas(df, preserve_index=False))
+        _write_atomically(PREPARED_CACHE.absolute(),
+                          lambda tmp: pq.write_table(table, tmp, compression='zstd'))
+    return df
+
 def rebuild():
-    # 1. Charger les données brutes
-    print("📖 Chargement du CSV...")
-    df = pd.read_csv('product_info_cleaned.csv')
+    # Import tardif : torch + transformers ne sont chargés que pour la re-génération,
+    # pas pour `from init_engine import read_products` (API, benchmarks)
+    from nlp_engine import (PureSkinNLPEngine, export_quantized_onnx, ONNX_AVAILABLE,
+                            SIMILARITY_MODEL_NAME, SENTIMENT_MODEL_NAME)
+
+    # 0. Export ONNX INT8 hors ligne (jamais dans le service) : l'index est alors encodé
+    # avec le même modèle quantifié que les requêtes de l'API
+    if ONNX_AVAILABLE:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTModelForSequenceClassification
+        try:
+            export_quantized_onnx(ORTModelForFeatureExtraction, SIMILARITY_MODEL_NAME)
+            export_quantized_onnx(ORTModelForSequenceClassification, SENTIMENT_MODEL_NAME)
+        except Exception as e:
+            logger.warning(f"⚠️ Export ONNX impossible ({e}), index encodé avec PyTorch.")
 
-    # 2. Initialiser le moteur (en mode création)
-    engine = PureSkinNLPEngine(enable_cache=False)
+    # 1-2. Charger les données brutes et initialiser le moteur (en mode création) en parallèle :
+    # le parsing CSV libère le GIL pendant que les modèles se chargent
+    print("📖 Chargement du CSV et des modèles en parallèle...")
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_engine = ex.submit(PureSkinNLPEngine, enable_cache=False)
+        f_df = ex.submit(load_prepared, 'product_info_cleaned.csv')
+        engine, df = f_engine.result(), f_df.result()
 
     # 3. Lancer la vectorisation et la catégorisation automatique
     # C'est ici que detect_categories est appliqué à chaque ligne
@@ -19,7 +182,7 @@ def rebuild():
     engine.load_and_vectorize_data(df)
 
     # 4. Sauvegarder le nouveau moteur
-    print("💾 Sauvegarde du fichier pure_skin_engine.pt...")
+    print("💾 Sauvegarde de l'index memmap (pure_skin_engine.json + matrices brutes)...")
     engine.save_engine("pure_skin_engine.pt")
     
     print("✅ Re-génération terminée !")
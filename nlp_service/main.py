@@ -1,17 +1,59 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Set, Tuple
 import pandas as pd
 import io
+import os
+import asyncio
+import multiprocessing
+import re
 import logging
 import traceback
 from pathlib import Path
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
 from fastapi.middleware.cors import CORSMiddleware
-from difflib import SequenceMatcher
+from fastapi.middleware.gzip import GZipMiddleware
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+
+    class DefaultResponse(ORJSONResponse):
+        """ORJSONResponse acceptant directement scalaires/tableaux NumPy et clés non-str."""
+
+        def render(self, content) -> bytes:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    ORJSON_AVAILABLE = True
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultResponse
+    ORJSON_AVAILABLE = False
+from rapidfuzz import fuzz, process
+from sklearn.feature_extraction.text import TfidfVectorizer
 import numpy as np
+import hashlib
+
+# Visualisation (optionnelle) : importée une fois, backend sans affichage
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    MATPLOTLIB_AVAILABLE = True
+except ImportError:
+    MATPLOTLIB_AVAILABLE = False
+
+try:
+    from openTSNE import TSNE as OpenTSNE  # Multi-thread, init PCA
+    OPENTSNE_AVAILABLE = True
+except ImportError:
+    OPENTSNE_AVAILABLE = False
 
 # --- IMPORTS LOCAUX ---
+# Lecteur du catalogue : indépendant du moteur, une erreur ici ne doit pas activer le mock
+try:
+    from init_engine import read_products_mmap
+except ImportError:
+    read_products_mmap = pd.read_csv
+
 try:
     from nlp_engine import PureSkinNLPEngine
 except ImportError:
@@ -43,8 +85,11 @@ except ImportError:
         def analyze_review(self, text, skin_type):
             return {"mock": True}
 
+        def analyze_reviews(self, texts, skin_type):
+            return [{"mock": True} for _ in texts]
+
 try:
-    from ocr_service import extract_product_info_enhanced
+    from ocr_service import extract_product_info_from_bytes
     OCR_AVAILABLE = True
     print("✅ Module OCR chargé avec succès.")
 except ImportError as e:
@@ -66,7 +111,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="PureSkin NLP Service - Intelligent Scanner",
     version="7.1",
-    description="API optimisée pour l'analyse cosmétique + OCR + matching DB (rating)"
+    description="API optimisée pour l'analyse cosmétique + OCR + matching DB (rating)",
+    default_response_class=DefaultResponse
 )
 
 app.add_middleware(
@@ -77,8 +123,111 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compression des réponses volumineuses (listes d'ingrédients, alternatives) ; niveau 4 = peu de CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=4)
+
+def fast_json(content):
+    """Réponse rendue directement par orjson (NumPy natif), sans passer par jsonable_encoder.
+
+    FastAPI n'applique jsonable_encoder qu'aux valeurs de retour qui ne sont pas des Response.
+    Sans orjson, le contenu est renvoyé tel quel et encodé par FastAPI.
+    """
+    return DefaultResponse(content=content) if ORJSON_AVAILABLE else content
+
 # --- VARIABLES GLOBALES ---
 engine: PureSkinNLPEngine = None
+OCR_POOL: Optional[ProcessPoolExecutor] = None
+# Processus OCR par worker uvicorn (borné : le total est multiplié par UVICORN_WORKERS)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+
+# Cache LRU des résultats OCR, indexé par l'empreinte BLAKE2 du contenu de l'image
+OCR_CACHE_SIZE = 1024
+ocr_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+async def run_ocr(contents: bytes) -> dict:
+    """OCR hors de la boucle d'événements dans le pool de processus, seuls les octets sont transmis.
+
+    Une image déjà scannée (même contenu) est servie depuis le cache sans relancer Tesseract.
+    """
+    key = hashlib.blake2b(contents, digest_size=16).hexdigest()
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        ocr_cache.move_to_end(key)
+        return dict(cached)
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(OCR_POOL, extract_product_info_from_bytes, contents, False)
+
+    # Les échecs ne sont pas mémorisés : un nouvel essai relance l'OCR
+    if result.get("success"):
+        ocr_cache[key] = result
+        if len(ocr_cache) > OCR_CACHE_SIZE:
+            ocr_cache.popitem(last=False)
+    return dict(result)
+
+# Micro-batching des embeddings : les requêtes arrivées dans la même fenêtre de 10 ms
+# partagent une seule passe du transformer (encode_batch)
+EMBED_BATCH_MAX = 8
+EMBED_BATCH_WAIT_S = 0.010
+embed_queue: Optional[asyncio.Queue] = None
+embed_batcher_task: Optional[asyncio.Task] = None
+
+async def _embedding_batcher():
+    """Tâche de fond : vide la file par lots (≤ EMBED_BATCH_MAX, ≤ 10 ms d'attente) et encode chaque lot."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await embed_queue.get()]
+        deadline = loop.time() + EMBED_BATCH_WAIT_S
+        while len(batch) < EMBED_BATCH_MAX:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(embed_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            embeddings = await asyncio.to_thread(engine.encode_batch, [text for text, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+        for (_, fut), emb in zip(batch, embeddings):
+            if not fut.done():
+                fut.set_result(emb)
+
+async def embed_query(text: str) -> np.ndarray:
+    """Embedding normalisé d'une liste INCI : cache LRU du moteur, sinon passage par le micro-batcher."""
+    global embed_queue, embed_batcher_task
+    cached = engine._get_cached_embedding(engine.clean_and_weight_ingredients(text))
+    if cached is not None:
+        return cached
+
+    if embed_batcher_task is None:
+        embed_queue = asyncio.Queue()
+        embed_batcher_task = asyncio.create_task(_embedding_batcher())
+    fut = asyncio.get_running_loop().create_future()
+    await embed_queue.put((text, fut))
+    return await fut
+
+# Lecture des uploads par blocs (évite le tampon intermédiaire de file.read())
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = 8 * 1024 * 1024
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Copie l'upload bloc par bloc dans un seul tampon et renvoie ses octets (413 au-delà de 8 Mo)."""
+    # Taille annoncée : refus avant toute lecture
+    size = getattr(file, "size", None)
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise HTTPException(413, "Image trop volumineuse (max 8 Mo)")
+    buf = io.BytesIO()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        buf.write(chunk)
+        if buf.tell() > MAX_UPLOAD_BYTES:
+            raise HTTPException(413, "Image trop volumineuse (max 8 Mo)")
+    return buf.getvalue()
 
 # --- MODÈLES DE DONNÉES ---
 class QualityRequest(BaseModel):
@@ -91,12 +240,18 @@ class DupeRequest(BaseModel):
     target_price: float = 0.0
     primary_category: Optional[str] = None
     secondary_category: Optional[str] = None
-    top_n: int = 20
+    top_n: int = Field(20, ge=1, le=100)
 
 class ReviewRequest(BaseModel):
     text: str
     skin_type: Optional[str] = "all"
 
+MAX_REVIEWS_PER_BATCH = 256
+
+class ReviewBatchRequest(BaseModel):
+    texts: List[str]
+    skin_type: Optional[str] = "all"
+
 class RecoRequest(BaseModel):
     skin_type: str
     max_price: Optional[float] = None
@@ -107,15 +262,49 @@ class ProductFavorite(BaseModel):
     price: float = 0.0
     similarity: float = 0.0
     primary_category: str = "Unknown"
-favorites_db = []
+# Favoris indexés par (marque, nom) : ajout / doublon / suppression en O(1)
+favorites_db: Dict[Tuple[str, str], ProductFavorite] = {}
+# Nom -> clés (marque, nom), pour la suppression par nom sans parcourir les favoris
+favorites_by_name: Dict[str, Set[Tuple[str, str]]] = {}
+favorites_lock = asyncio.Lock()
+
+# Candidats TF-IDF re-scorés par rapidfuzz dans /analyze/scan
+SCAN_CANDIDATES = 200
+
+def _scan_index() -> dict:
+    """Index de matching nom/marque, construit une fois par catalogue chargé.
+
+    - names : noms en minuscules (tableau NumPy)
+    - brand_codes / brand_values : marques encodées en dictionnaire (codes int32 + marques
+      uniques en minuscules) ; les marques se répètent beaucoup, seules les uniques sont traitées
+    - vectorizer / matrix : TF-IDF n-grammes de caractères (lignes L2-normalisées)
+    """
+    df = engine.products_df_indexed
+    cached = getattr(engine, "_scan_index_cache", None)
+    if cached is None or cached["df"] is not df:
+        names = df["product_name"].astype(str).str.lower().to_numpy()
+        codes, uniques = pd.factorize(df["brand_name"].astype(str))
+        brand_codes = codes.astype(np.int32)
+        brand_values = pd.Index(uniques).str.lower().to_numpy()
+        vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), dtype=np.float32)
+        matrix = vectorizer.fit_transform(names + " " + brand_values[brand_codes]).tocsr()
+        cached = {"df": df, "names": names, "brand_codes": brand_codes, "brand_values": brand_values,
+                  "vectorizer": vectorizer, "matrix": matrix}
+        engine._scan_index_cache = cached
+    return cached
 
 
 # --- DÉMARRAGE OPTIMISÉ ---
 @app.on_event("startup")
 async def startup_event():
-    global engine
+    global engine, OCR_POOL
     logger.info("🚀 Démarrage du service PureSkin 7.1...")
 
+    # Pool OCR créé en "spawn" : un fork après le démarrage des pools de threads
+    # torch / ONNX Runtime peut bloquer le processus enfant
+    OCR_POOL = ProcessPoolExecutor(max_workers=max(1, OCR_WORKERS),
+                                   mp_context=multiprocessing.get_context("spawn"))
+
     try:
         engine = PureSkinNLPEngine(enable_cache=True)
 
@@ -130,7 +319,7 @@ async def startup_event():
             # 2) fallback CSV
             csv_path = Path("product_info_cleaned.csv")
             if csv_path.exists():
-                df = pd.read_csv(csv_path)
+                df = read_products_mmap(csv_path)
                 engine.load_and_vectorize_data(df)
                 try:
                     engine.save_engine("pure_skin_engine.pt")
@@ -149,11 +338,24 @@ async def startup_event():
                 df = pd.DataFrame(mock_data)
                 engine.load_and_vectorize_data(df)
 
+        # Index de matching du scan et filtres construits au démarrage, pas à la première requête
+        if engine.products_df_indexed is not None and not engine.products_df_indexed.empty:
+            _scan_index()
+            _filters_payload()
+
     except Exception as e:
         logger.error(f"❌ Erreur critique au démarrage : {e}")
         logger.error(traceback.format_exc())
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if OCR_POOL is not None:
+        OCR_POOL.shutdown(wait=False, cancel_futures=True)
+    if embed_batcher_task is not None:
+        embed_batcher_task.cancel()
+
+
 # --- ENDPOINTS PRINCIPAUX ---
 @app.get("/")
 def read_root():
@@ -178,11 +380,11 @@ async def api_analyze_quality(request: QualityRequest):
     if not engine:
         raise HTTPException(503, "Moteur non prêt")
 
-    return engine.get_full_product_report(
+    return fast_json(engine.get_full_product_report(
         request.product_name,
         request.ingredients,
         request.brand_name
-    )
+    ))
 
 @app.post("/analyze/find_dupes")
 async def find_dupes(req: DupeRequest):
@@ -191,42 +393,55 @@ async def find_dupes(req: DupeRequest):
 
     logger.info(f"🔎 Recherche Smart Dupe pour produit à {req.target_price}$")
 
-    candidates = engine.find_similar_products(
-        target_ingredients=req.ingredients,
-        target_price=0,
-        top_n=req.top_n,
-        primary=req.primary_category,
-        secondary=req.secondary_category
+    if hasattr(engine, "encode_batch") and engine.product_embeddings is not None:
+        # Encodage mutualisé avec les requêtes concurrentes, puis recherche sur la requête préparée
+        query_emb = await embed_query(req.ingredients)
+        candidates = engine.search_prepared(
+            engine.prepare_query(req.ingredients, query_emb=query_emb),
+            target_price=0,
+            top_n=req.top_n,
+            primary=req.primary_category,
+            secondary=req.secondary_category
+        )
+    else:
+        candidates = engine.find_similar_products(
+            target_ingredients=req.ingredients,
+            target_price=0,
+            top_n=req.top_n,
+            primary=req.primary_category,
+            secondary=req.secondary_category
+        )
+
+    # Filtre vectorisé : un masque NumPy sur (prix, similarité) au lieu d'une boucle Python
+    arr = np.array(
+        [(c.get("price", 0) or 0, c.get("similarity", 0) or 0) for c in candidates],
+        dtype=[("p", "f4"), ("s", "f4")]
     )
-
+    mask = arr["s"] > 0.70
+    savings = np.zeros(len(arr), dtype=np.float32)
+    if req.target_price > 0:
+        mask &= (arr["p"] > 0) & (arr["p"] < req.target_price * 0.85)
+        savings = req.target_price - arr["p"]
+
+    dupe_idx = np.flatnonzero(mask)
+    # Tri stable par similarité décroissante
+    dupe_idx = dupe_idx[np.argsort(-arr["s"][dupe_idx], kind="stable")]
     smart_dupes = []
-    for prod in candidates:
-        price = prod.get("price", 0) or 0
-        similarity = prod.get("similarity", 0) or 0
-
-        is_cheaper = True
-        savings = 0.0
-
-        if req.target_price > 0:
-            if price > 0 and price < (req.target_price * 0.85):
-                savings = req.target_price - price
-            else:
-                is_cheaper = False
-
-        if similarity > 0.70 and is_cheaper:
-            prod["savings_amount"] = round(savings, 2)
-            prod["is_economic_dupe"] = True
-            smart_dupes.append(prod)
+    for i in dupe_idx:
+        prod = candidates[i]
+        prod["savings_amount"] = round(float(savings[i]), 2)
+        prod["is_economic_dupe"] = True
+        smart_dupes.append(prod)
 
     if smart_dupes:
-        smart_dupes.sort(key=lambda x: x.get("similarity", 0), reverse=True)
-        return {"found_cheaper_dupe": True, "best_dupe": smart_dupes[0], "alternatives": smart_dupes[:5]}
+        return fast_json({"found_cheaper_dupe": True, "best_dupe": smart_dupes[0],
+                          "alternatives": smart_dupes[:5]})
 
-    return {
+    return fast_json({
         "found_cheaper_dupe": False,
         "message": "Aucun dupe significativement moins cher trouvé.",
         "alternatives": candidates[:5] if candidates else []
-    }
+    })
 
 @app.post("/analyze/ocr_only")
 async def ocr_only(file: UploadFile = File(...)):
@@ -234,10 +449,10 @@ async def ocr_only(file: UploadFile = File(...)):
     if not OCR_AVAILABLE:
         raise HTTPException(501, "Module OCR non installé")
 
+    contents = await read_upload(file)
+
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        return extract_product_info_enhanced(image, debug_mode=False)
+        return await run_ocr(contents)
     except Exception as e:
         logger.error(f"Erreur OCR: {e}")
         logger.error(traceback.format_exc())
@@ -251,11 +466,10 @@ async def ocr_rating(file: UploadFile = File(...)):
     if not OCR_AVAILABLE:
         raise HTTPException(501, "Module OCR non installé")
 
-    try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+    contents = await read_upload(file)
 
-        ocr_result = extract_product_info_enhanced(image, debug_mode=False)
+    try:
+        ocr_result = await run_ocr(contents)
         if not ocr_result.get("success"):
             return {"success": False, "error": ocr_result.get("error", "Erreur OCR")}
 
@@ -290,12 +504,11 @@ async def scan_product(file: UploadFile = File(...)):
     if not engine:
         raise HTTPException(503, "Moteur non prêt")
 
-    try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+    contents = await read_upload(file)
 
+    try:
         # 1) OCR
-        ocr_result = extract_product_info_enhanced(image, debug_mode=False)
+        ocr_result = await run_ocr(contents)
         if not ocr_result.get("success"):
             return {"success": False, "error": ocr_result.get("error", "Erreur OCR")}
 
@@ -304,6 +517,7 @@ async def scan_product(file: UploadFile = File(...)):
 
         # 2) Recherche DB dans engine (fix brand_name)
         matches = []
+        match_count = 0
         analysis = None
 
         df = engine.products_df_indexed
@@ -311,28 +525,46 @@ async def scan_product(file: UploadFile = File(...)):
             search_name = str(product_name).lower().strip()
             search_brand = str(brand).lower().strip()
 
-            for _, row in df.iterrows():
-                db_name = str(row.get("product_name", "")).lower()
-                # ✅ IMPORTANT: brand_name (fallback brand si existe)
-                db_brand = str(row.get("brand_name", row.get("brand", ""))).lower()
-
-                name_similarity = SequenceMatcher(None, search_name, db_name).ratio()
-                brand_similarity = SequenceMatcher(None, search_brand, db_brand).ratio()
-
-                if name_similarity > 0.60 or (brand_similarity > 0.80 and name_similarity > 0.30):
-                    matches.append({
-                        "product_name": row.get("product_name"),
-                        "brand_name": row.get("brand_name", row.get("brand", "")),
-                        "ingredients": row.get("ingredients", ""),
-                        "price_usd": row.get("price_usd", 0),
-                        "rating": row.get("rating", None),
-                        "primary_category": row.get("primary_category", ""),
-                        "similarity_score": round(max(name_similarity, brand_similarity), 2),
-                        "match_type": "name_match"
-                    })
+            # Pré-sélection TF-IDF (un produit matrice creuse × vecteur), puis similarités
+            # floues exactes en C (rapidfuzz) sur les seuls candidats
+            index = _scan_index()
+            candidates = np.arange(len(index["names"]))
+            if candidates.size > SCAN_CANDIDATES:
+                query_vec = index["vectorizer"].transform([f"{search_name} {search_brand}"])
+                tfidf_scores = (index["matrix"] @ query_vec.T).toarray().ravel()
+                candidates = np.sort(np.argpartition(-tfidf_scores, SCAN_CANDIDATES - 1)[:SCAN_CANDIDATES])
+            name_scores = process.cdist([search_name], index["names"][candidates], scorer=fuzz.ratio,
+                                        dtype=np.float32, workers=-1)[0] / 100
+            # Marques : une seule comparaison par marque distincte, puis diffusion par les codes
+            cand_brands, brand_inverse = np.unique(index["brand_codes"][candidates], return_inverse=True)
+            brand_scores = process.cdist([search_brand], index["brand_values"][cand_brands], scorer=fuzz.ratio,
+                                         dtype=np.float32, workers=-1)[0][brand_inverse] / 100
+
+            hit_pos = np.flatnonzero((name_scores > 0.60) | ((brand_scores > 0.80) & (name_scores > 0.30)))
+            hit_rows = candidates[hit_pos]
+            name_scores, brand_scores = name_scores[hit_pos], brand_scores[hit_pos]
+            hit_scores = np.round(np.maximum(name_scores, brand_scores), 2)
+            # Tri stable : à score égal, l'ordre du catalogue est conservé
+            order = np.argsort(-hit_scores, kind="stable")
+            hit_rows, hit_scores = hit_rows[order], hit_scores[order]
+            match_count = int(hit_rows.size)
+
+            # Seules les lignes renvoyées sont matérialisées (types natifs pour la sérialisation)
+            for row_idx, score in zip(hit_rows[:5], hit_scores[:5]):
+                row = df.iloc[row_idx]
+                rating = row.get("rating", None)
+                matches.append({
+                    "product_name": str(row.get("product_name")),
+                    "brand_name": str(row.get("brand_name", row.get("brand", ""))),
+                    "ingredients": str(row.get("ingredients", "")),
+                    "price_usd": float(row.get("price_usd", 0) or 0),
+                    "rating": float(rating) if pd.notna(rating) else None,
+                    "primary_category": str(row.get("primary_category", "")),
+                    "similarity_score": round(float(score), 2),
+                    "match_type": "name_match"
+                })
 
             if matches:
-                matches.sort(key=lambda x: x["similarity_score"], reverse=True)
                 best_match = matches[0]
 
                 analysis = engine.get_full_product_report(
@@ -341,7 +573,7 @@ async def scan_product(file: UploadFile = File(...)):
                     brand=best_match["brand_name"]
                 )
 
-        return {
+        return fast_json({
             "success": True,
             "ocr_data": {
                 "brand": brand,
@@ -352,14 +584,14 @@ async def scan_product(file: UploadFile = File(...)):
                 "price_from_ocr_service": ocr_result.get("price_usd", None),
             },
             "database_matches": {
-                "count": len(matches),
+                "count": match_count,
                 "matches": matches[:5]
             },
             "analysis": analysis if analysis else {
                 "warning": "Aucun produit correspondant trouvé dans la base de données",
                 "suggestion": "Essayez /analyze/ocr_rating (OCR + DB) ou saisissez les ingrédients via /analyze/quality"
             }
-        }
+        })
 
     except Exception as e:
         logger.error(f"Erreur Scan: {e}")
@@ -383,10 +615,64 @@ async def review_analysis(req: ReviewRequest):
     if not engine:
         raise HTTPException(503, "Moteur non prêt")
     return engine.analyze_review(req.text, req.skin_type)
+
+@app.post("/analyze/reviews")
+async def reviews_analysis(req: ReviewBatchRequest):
+    """Sentiment de plusieurs avis en un seul passage du modèle (résultats dans l'ordre reçu)."""
+    if not engine:
+        raise HTTPException(503, "Moteur non prêt")
+    if len(req.texts) > MAX_REVIEWS_PER_BATCH:
+        raise HTTPException(413, f"Maximum {MAX_REVIEWS_PER_BATCH} avis par requête")
+    return {"results": engine.analyze_reviews(req.texts, req.skin_type)}
+
+# Types reconnus dans les noms de produits quand secondary_category est absente
+COMMON_TYPES = ["Serum", "Cream", "Cleanser", "Toner", "Moisturizer", "Mask", "Oil", "Sunscreen"]
+COMMON_TYPES_RE = re.compile("|".join(map(re.escape, COMMON_TYPES)), re.IGNORECASE)
+
+def _sorted_unique(col: pd.Series) -> list:
+    """Valeurs distinctes triées ; une colonne catégorielle fournit déjà son dictionnaire."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        values = col.cat.remove_unused_categories().cat.categories
+    else:
+        values = col.dropna().unique()
+    return sorted({str(v) for v in values})
+
+def _filters_payload() -> dict:
+    """Listes uniques catégories / marques / types, calculées une fois par catalogue chargé."""
+    df = engine.products_df_indexed
+    cached = getattr(engine, "_filters_cache", None)
+    if cached is not None and cached[0] is df:
+        return cached[1]
+
+    # 1. Récupération des Catégories (primary_category)
+    # On nettoie : pas de null, trié alphabétiquement
+    categories = []
+    if "primary_category" in df.columns:
+        categories = _sorted_unique(df["primary_category"])
+
+    # 2. Récupération des Marques (brand_name)
+    brands = []
+    if "brand_name" in df.columns:
+        brands = _sorted_unique(df["brand_name"])
+
+    # 3. Récupération des Types (secondary_category ou inference)
+    types = []
+    if "secondary_category" in df.columns:
+        types = _sorted_unique(df["secondary_category"])
+    else:
+        # Une seule regex compilée sur la colonne : on ne garde que les types présents dans la DB
+        found = df["product_name"].astype(str).str.findall(COMMON_TYPES_RE).explode().dropna()
+        present = set(found.str.lower())
+        types = [t for t in COMMON_TYPES if t.lower() in present]
+
+    payload = {"categories": categories, "brands": brands, "types": types}
+    engine._filters_cache = (df, payload)
+    return payload
+
 @app.get("/analyze/filters")
 async def get_filters():
     """
-    Récupère les listes uniques de catégories et marques depuis la DB chargée.
+    Récupère les listes uniques de catégories et marques depuis la DB chargée (cache).
     """
     if not engine or engine.products_df_indexed is None:
         return {
@@ -396,65 +682,36 @@ async def get_filters():
         }
 
     try:
-        df = engine.products_df_indexed
-        
-        # 1. Récupération des Catégories (primary_category)
-        # On nettoie : pas de null, title case, trié alphabétiquement
-        categories = []
-        if "primary_category" in df.columns:
-            categories = sorted(df["primary_category"].dropna().astype(str).unique().tolist())
-        
-        # 2. Récupération des Marques (brand_name)
-        brands = []
-        if "brand_name" in df.columns:
-            # On prend les marques qui ont au moins 2 produits pour éviter le bruit
-            # (Optionnel, tu peux retirer value_counts si tu veux tout)
-            brands = sorted(df["brand_name"].dropna().astype(str).unique().tolist())
-
-        # 3. Récupération des Types (secondary_category ou inference)
-        # Si tu as une colonne 'product_type' ou 'secondary_category', utilise-la.
-        # Sinon, on peut scanner les mots clés fréquents dans product_name
-        types = []
-        if "secondary_category" in df.columns:
-             types = sorted(df["secondary_category"].dropna().astype(str).unique().tolist())
-        else:
-            # Liste dynamique basée sur ce qui existe vraiment
-            common_types = ["Serum", "Cream", "Cleanser", "Toner", "Moisturizer", "Mask", "Oil", "Sunscreen"]
-            # On ne garde que ceux qui apparaissent dans les noms de produits de la DB
-            all_names = " ".join(df["product_name"].astype(str).tolist()).lower()
-            types = [t for t in common_types if t.lower() in all_names]
-
-        return {
-            "categories": categories,
-            "brands": brands,
-            "types": types
-        }
-
+        return _filters_payload()
     except Exception as e:
         logger.error(f"Erreur récupération filtres: {e}")
         return {"categories": [], "brands": [], "types": []}
+
 @app.get("/favorites")
 async def get_favorites():
     """Récupère la liste des favoris"""
-    return favorites_db
+    return list(favorites_db.values())
 
 @app.post("/favorites")
 async def add_favorite(product: ProductFavorite):
     """Ajoute un produit aux favoris"""
-    # Vérifie si déjà présent pour éviter les doublons
-    for fav in favorites_db:
-        if fav.product_name == product.product_name and fav.brand_name == product.brand_name:
+    key = (product.brand_name, product.product_name)
+    async with favorites_lock:
+        # Vérifie si déjà présent pour éviter les doublons
+        if key in favorites_db:
             return {"message": "Déjà dans les favoris"}
-    
-    favorites_db.append(product)
-    return {"message": "Ajouté", "count": len(favorites_db)}
+
+        favorites_db[key] = product
+        favorites_by_name.setdefault(product.product_name, set()).add(key)
+        return {"message": "Ajouté", "count": len(favorites_db)}
 
 @app.delete("/favorites/{product_name}")
 async def remove_favorite(product_name: str):
     """Retire un produit (par son nom pour simplifier)"""
-    global favorites_db
-    favorites_db = [p for p in favorites_db if p.product_name != product_name]
-    return {"message": "Retiré", "count": len(favorites_db)}
+    async with favorites_lock:
+        for key in favorites_by_name.pop(product_name, ()):
+            del favorites_db[key]
+        return {"message": "Retiré", "count": len(favorites_db)}
 
 # --- DEBUG & VISUALISATION (Optionnel) ---
 @app.get("/debug/visualization")
@@ -462,18 +719,33 @@ async def trigger_visualization():
     if not engine:
         return {"error": "Engine not loaded"}
 
-    try:
-        import matplotlib
-        matplotlib.use("Agg")
-        import matplotlib.pyplot as plt
-        from sklearn.manifold import TSNE
+    if not MATPLOTLIB_AVAILABLE:
+        return {"error": "matplotlib non installé"}
 
+    try:
         if engine.product_embeddings is not None:
-            embeddings = engine.product_embeddings.cpu().numpy()
-            sample_size = min(500, len(embeddings))
-            indices = np.random.choice(len(embeddings), sample_size, replace=False)
-            tsne = TSNE(n_components=2, perplexity=30, random_state=42)
-            vis_data = tsne.fit_transform(embeddings[indices])
+            # Échantillon tiré avant l'extraction : seules ces lignes sont copiées (et lues si memmap).
+            # Tirage seedé : même catalogue -> même échantillon -> carte réutilisable
+            n_products = len(engine.product_embeddings)
+            sample_size = min(500, n_products)
+            rng = np.random.default_rng(42)
+            indices = np.sort(rng.choice(n_products, sample_size, replace=False))
+            embeddings = np.ascontiguousarray(engine.product_embeddings[indices].cpu().numpy())
+
+            # Carte déjà calculée pour ces vecteurs : pas de nouveau TSNE
+            key = hashlib.blake2b(embeddings.tobytes() + str(sample_size).encode(), digest_size=8).hexdigest()
+            filename = f"debug_map_{key}.png"
+            if Path(filename).exists():
+                return {"success": True, "file": filename, "cached": True}
+
+            if OPENTSNE_AVAILABLE:
+                vis_data = np.asarray(
+                    OpenTSNE(n_jobs=-1, initialization="pca", perplexity=30, random_state=42).fit(embeddings)
+                )
+            else:
+                from sklearn.manifold import TSNE
+                tsne = TSNE(n_components=2, perplexity=30, init="pca", random_state=42)
+                vis_data = tsne.fit_transform(embeddings)
 
             plt.figure(figsize=(10, 6))
             plt.scatter(vis_data[:, 0], vis_data[:, 1], alpha=0.5)
@@ -481,7 +753,6 @@ async def trigger_visualization():
             plt.xlabel("TSNE Component 1")
             plt.ylabel("TSNE Component 2")
 
-            filename = "debug_map.png"
             plt.savefig(filename)
             plt.close()
             return {"success": True, "file": filename}
@@ -494,4 +765,15 @@ if __name__ == "__main__":
     import uvicorn
     print("🚀 Démarrage de l'API PureSkin sur http://0.0.0.0:8000")
     print("📚 Documentation: http://127.0.0.1:8000/docs")
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # uvloop + httptools quand ils sont installés ("auto" : asyncio / h11 sinon, ex. Windows),
+    # un seul worker par défaut : favoris, caches OCR / embeddings /
+    # visualisation sont propres au processus et chaque worker recharge modèle + embeddings.
+    # UVICORN_WORKERS > 1 uniquement si ces limites sont acceptables
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("UVICORN_WORKERS", "1")),
+    )
@@ -1,29 +1,304 @@
 import pandas as pd
 import numpy as np
 import torch
+import os
 import re
+import json
 import warnings
 import logging
-import hashlib
+import functools
+import shutil
+import tempfile
+from collections import OrderedDict, defaultdict
 from dataclasses import dataclass
 from typing import Optional, Dict, Any, List, Tuple
-from transformers import pipeline, AutoTokenizer
-from sentence_transformers import SentenceTransformer, util
+from transformers import pipeline, AutoConfig, AutoTokenizer
+from sentence_transformers import SentenceTransformer
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import onnxruntime as ort
+    from optimum.onnxruntime import (ORTModelForFeatureExtraction, ORTModelForSequenceClassification,
+                                     ORTQuantizer)
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Nombre de candidats int8 re-classés en FP32 exact
+RERANK_CANDIDATES = 100
+
+# Taille max du cache LRU des embeddings de requête
+QUERY_CACHE_SIZE = 1024
+
+# Nettoyage INCI : synonymes (une alternation compilée), concentrations, caractères, bruit
+INCI_SYNONYMS = {
+    'aqua': 'water', 'eau': 'water',
+    'parfum': 'fragrance',
+    'alcohol denat.': 'alcohol',
+    'l-ascorbic acid': 'ascorbic acid', # Vitamin C
+    'tocopherol': 'vitamin e'
+}
+INCI_SYNONYM_RE = re.compile('|'.join(map(re.escape, INCI_SYNONYMS)))
+INCI_CONCENTRATION_RE = re.compile(r'\d+(\.\d+)?%')
+INCI_CHARS_RE = re.compile(r'[^a-z0-9 /()+-]')
+INCI_NOISE = frozenset({'water', 'glycerin', 'glycerine', 'phenoxyethanol', 'alcohol'})
+
+def _inci_synonym(match: re.Match) -> str:
+    return INCI_SYNONYMS[match.group(0)]
+
+def _join_inci_parts(text: str) -> str:
+    """Découpe sur les virgules, garde lettres/chiffres/chimie, retire le bruit."""
+    cleaned = []
+    for part in text.split(','):
+        p = INCI_CHARS_RE.sub('', part.strip())
+        if p.strip() not in INCI_NOISE and len(p) > 2:
+            cleaned.append(p.strip())
+    # Note: Pour SciBERT, on évite la duplication (poids * 2) car le modèle
+    # comprend le contexte global de la formule.
+    return " ".join(cleaned) if cleaned else "unknown"
+
+# Ingrédients à risque par catégorie, repérés en une seule passe regex (alternation compilée)
+HAZARDS = {
+    "comedogenic": ['isopropyl myristate', 'coconut oil', 'sodium chloride', 'lanolin'],
+    "irritants": ['fragrance', 'parfum', 'alcohol denat', 'menthol', 'linalool'],
+    "check_list": ['paraben', 'sulfate', 'phthalate', 'formaldehyde']
+}
+HAZARD_RE = re.compile('|'.join(re.escape(term) for terms in HAZARDS.values() for term in terms))
+
+# Règles de catégorisation, compilées une fois (ordre = priorité)
+PRIMARY_PATTERNS = [
+    ("Haircare", re.compile(r'\b(shampoo|conditioner|hair|cheveux|scalp)\b')),
+    ("Makeup", re.compile(r'\b(foundation|makeup|maquillage|lipstick|mascara)\b')),
+    ("Bodycare", re.compile(r'\b(shower gel|body wash|savon|soap|body)\b')),
+    ("Fragrance", re.compile(r'\b(parfum|perfume|fragrance|scent)\b')),
+]
+SECONDARY_PATTERNS = [
+    ('cream', re.compile(r'\b(cream|crème|moisturizer|hydratant|lotion|balm|baume)\b')),
+    ('serum', re.compile(r'\b(serum|sérum|concentrate|concentré|ampoule)\b')),
+    ('cleanser', re.compile(r'\b(cleanser|nettoyant|wash|gel nettoyant|mousse|micellar)\b')),
+    ('toner', re.compile(r'\b(toner|tonique|lotion tonique)\b')),
+    ('mask', re.compile(r'\b(mask|masque|patch)\b')),
+    ('sunscreen', re.compile(r'\b(sunscreen|spf|écran|solaire|uv)\b')),
+    ('oil', re.compile(r'\b(oil|huile)\b')),
+    ('scrub', re.compile(r'\b(scrub|gommage|exfoliant|peeling)\b')),
+]
+
+# Modèles ONNX exportés + quantifiés INT8 (générés hors ligne par init_engine.py)
+ONNX_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_models")
+
+# Encodeur ayant produit les embeddings (enregistré dans les métadonnées de l'index) :
+# requêtes et catalogue doivent venir du même, sinon les seuils cosinus ne tiennent plus
+ENCODER_TORCH_FP32 = "torch-fp32"
+ENCODER_ONNX_INT8 = "onnx-int8"
+
+# Pré-filtre lexical INCI (optionnel, cf. prepare_query(prefilter=True)) : requêtes courtes
+# seulement, top-M lignes par recouvrement de tokens. Approché : un produit proche sans token
+# commun avec la requête n'est pas balayé
+INCI_TOKEN_RE = re.compile(r"[a-z0-9\-]+")
+PREFILTER_MAX_TOKENS = 8
+PREFILTER_CANDIDATES = 2000
+
+def _top_k_order(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions des k meilleurs scores, triées par score décroissant.
+
+    argpartition en O(N) puis tri des seuls k gagnants en O(k log k).
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    part = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+    return part[np.argsort(-scores[part])]
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _cosine_sweep(q, mat, out):
+        """Produit scalaire requête/lignes, réparti sur tous les cœurs (q et mat normalisés)."""
+        for i in prange(mat.shape[0]):
+            s = 0.0
+            for j in range(mat.shape[1]):
+                s += q[j] * mat[i, j]
+            out[i] = s
+
 @dataclass
 class TruncationConfig:
     max_tokens: int = 400
     preserve_end: bool = True
     preserve_key_sections: bool = True
 
+@dataclass
+class PreparedQuery:
+    """Requête encodée une seule fois, réutilisable pour plusieurs balayages."""
+    unit: np.ndarray                            # embedding FP32 L2-normalisé
+    q_i8: np.ndarray                            # forme int8 (1×D) pour la pré-sélection
+    q_scale: np.ndarray                         # échelle de q_i8
+    candidates: Optional[np.ndarray] = None     # lignes du pré-filtre lexical (cf. _token_prefilter)
+
+# Modèles partagés au niveau du module : un seul chargement par processus, même si
+# plusieurs moteurs sont construits (rechargements, scripts, tests)
+SENTIMENT_MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+# Modèle spécialisé dans les publications scientifiques/chimiques
+SIMILARITY_MODEL_NAME = "allenai/scibert_scivocab_uncased"
+
+@functools.lru_cache(maxsize=4)
+def get_tokenizer(name: str):
+    return AutoTokenizer.from_pretrained(name, use_fast=True)
+
+@functools.lru_cache(maxsize=2)
+def get_sentiment_pipeline(name: str = SENTIMENT_MODEL_NAME):
+    """Pipeline de sentiment : RoBERTa ONNX Runtime INT8 si disponible, sinon PyTorch FP32."""
+    model = name
+    if ONNX_AVAILABLE:
+        try:
+            int8_dir = quantized_onnx_dir(name)
+            model = ORTModelForSequenceClassification.from_pretrained(int8_dir, file_name="model_quantized.onnx")
+            logger.info("⚡ Sentiment servi par ONNX Runtime (INT8).")
+        except Exception as e:
+            logger.warning(f"⚠️ ONNX indisponible pour le sentiment ({e}), repli sur PyTorch.")
+            model = name
+    return pipeline(
+        "sentiment-analysis",
+        model=model,
+        tokenizer=get_tokenizer(name),
+        device=-1,
+        truncation=True,
+        max_length=512
+    )
+
+def _onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace('/', '__'))
+
+def quantized_onnx_dir(model_name: str) -> str:
+    """Dossier du modèle INT8 déjà exporté ; FileNotFoundError s'il n'a pas été généré.
+
+    Le service ne fait jamais l'export lui-même (cf. export_quantized_onnx, appelé par init_engine.py).
+    """
+    int8_dir = os.path.join(_onnx_model_dir(model_name), 'int8')
+    if not os.path.exists(os.path.join(int8_dir, 'model_quantized.onnx')):
+        raise FileNotFoundError(f"modèle ONNX INT8 absent pour {model_name} (lancer init_engine.py)")
+    return int8_dir
+
+def export_quantized_onnx(model_cls, model_name: str) -> str:
+    """Exporte le modèle en ONNX puis le quantifie en INT8 dynamique (hors ligne, une seule fois).
+
+    L'export est écrit dans un dossier temporaire puis renommé : un lecteur ne voit
+    jamais de modèle partiel. Retourne le dossier contenant model_quantized.onnx.
+    """
+    try:
+        return quantized_onnx_dir(model_name)
+    except FileNotFoundError:
+        pass
+    logger.info(f"🔧 Export ONNX + quantification INT8 de {model_name}...")
+    save_dir = _onnx_model_dir(model_name)
+    os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=ONNX_CACHE_DIR, prefix='.export-')
+    try:
+        fp32_dir = os.path.join(tmp_dir, 'fp32')
+        int8_dir = os.path.join(tmp_dir, 'int8')
+        model_cls.from_pretrained(model_name, export=True).save_pretrained(fp32_dir)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        ORTQuantizer.from_pretrained(fp32_dir).quantize(save_dir=int8_dir, quantization_config=qconfig)
+        # La config du modèle (labels, etc.) est nécessaire au rechargement
+        AutoConfig.from_pretrained(model_name).save_pretrained(int8_dir)
+        # Un export incomplet d'une exécution interrompue est remplacé
+        shutil.rmtree(save_dir, ignore_errors=True)
+        os.replace(tmp_dir, save_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return quantized_onnx_dir(model_name)
+
+@functools.lru_cache(maxsize=4)
+def get_similarity_model(name: str, backend: Optional[str] = None):
+    """Encodeur de phrases : ONNX Runtime INT8 si exporté, sinon SentenceTransformer (PyTorch).
+
+    `backend` impose l'encodeur (ENCODER_TORCH_FP32 / ENCODER_ONNX_INT8), ex. celui de l'index chargé.
+    """
+    if backend != ENCODER_TORCH_FP32 and ONNX_AVAILABLE:
+        try:
+            model = OnnxSentenceEncoder(name, max_seq_length=512)
+            logger.info("⚡ SciBERT servi par ONNX Runtime (INT8).")
+            return model
+        except Exception as e:
+            if backend == ENCODER_ONNX_INT8:
+                raise
+            logger.warning(f"⚠️ ONNX indisponible ({e}), repli sur PyTorch.")
+    elif backend == ENCODER_ONNX_INT8:
+        raise RuntimeError("onnxruntime / optimum non installés : encodeur INT8 indisponible")
+    model = SentenceTransformer(name)
+    model.max_seq_length = 512
+    return model
+
+def encoder_backend(model) -> str:
+    """Identifiant de l'encodeur (ENCODER_*) d'un modèle renvoyé par get_similarity_model."""
+    return getattr(model, 'backend', ENCODER_TORCH_FP32)
+
+class OnnxSentenceEncoder:
+    """Encodeur ONNX Runtime INT8 (quantification dynamique), même interface encode() que SentenceTransformer.
+
+    Tokenizer rapide + session ORT + mean-pooling masqué en NumPy (pooling par défaut de SciBERT).
+    """
+    backend = ENCODER_ONNX_INT8
+
+    def __init__(self, model_name: str, max_seq_length: int = 512):
+        quantized_path = os.path.join(quantized_onnx_dir(model_name), 'model_quantized.onnx')
+
+        self.tokenizer = get_tokenizer(model_name)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(quantized_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_seq_length = max_seq_length
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_tensor: bool = False,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            enc = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors='np')
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc['attention_mask'][..., None].astype(np.float32)
+            chunks.append((hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9))
+
+        if not chunks:
+            dim = self.session.get_outputs()[0].shape[-1]
+            return np.empty((0, dim if isinstance(dim, int) else 768), dtype=np.float32)
+        emb = np.ascontiguousarray(np.concatenate(chunks), dtype=np.float32)
+        if normalize_embeddings:
+            emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+        if convert_to_tensor:
+            emb = torch.from_numpy(emb)
+        return emb[0] if single else emb
+
 class SmartTextProcessor:
     def __init__(self):
         # Utilisation d'un tokenizer standard pour le calcul des limites de tokens
-        self.tokenizer = AutoTokenizer.from_pretrained("bert-base-uncased", use_fast=True)
+        self.tokenizer = get_tokenizer("bert-base-uncased")
     
     def smart_truncate(self, text: str, config: TruncationConfig = None) -> str:
         if config is None: 
@@ -44,206 +319,535 @@ class PureSkinNLPEngine:
         logger.info("🚀 Initialisation PureSkin NLP Engine (V7.1 - SciBERT Optimized)")
         self.text_processor = SmartTextProcessor()
         self.enable_cache = enable_cache
-        self.embedding_cache = {} if enable_cache else None
+        self.embedding_cache = OrderedDict() if enable_cache else None
+        self.cache_hits = 0
+        self.cache_misses = 0
         
         self.product_embeddings = None
+        self.product_embeddings_unit = None
+        self.product_norms = None
+        self.product_embeddings_i8 = None
+        self.product_scales = None
+        self.product_embeddings_gpu = None
+        self.product_prices = None
+        self.category_indices = {}
+        self.primary_indices = {}
+        self.pair_indices = {}
+        self.category_embeddings = {}
+        self.token_postings = {}
         self.products_df_indexed = None 
         
-        # Modèle spécialisé dans les publications scientifiques/chimiques
         # Note: Le warning "Creating a new one with mean pooling" est normal pour ce modèle
-        self.model_name = 'allenai/scibert_scivocab_uncased'
+        self.model_name = SIMILARITY_MODEL_NAME
         self._load_models()
     
+    @staticmethod
+    def _cache_key(text: str) -> str:
+        """Clé de cache : le texte normalisé (casse/espaces) lui-même, haché par le dict (SipHash)."""
+        return " ".join(text.lower().split())
+
     def _get_cached_embedding(self, text: str):
-        """Récupère un embedding depuis le cache mémoire"""
+        """Récupère un embedding depuis le cache mémoire (LRU)"""
         if not self.enable_cache or self.embedding_cache is None:
             return None
-        text_hash = hashlib.md5(text.encode()).hexdigest()
-        return self.embedding_cache.get(text_hash)
+        key = self._cache_key(text)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            self.cache_misses += 1
+            return None
+        self.embedding_cache.move_to_end(key)
+        self.cache_hits += 1
+        return embedding
     
     def _cache_embedding(self, text: str, embedding):
-        """Stocke un embedding dans le cache"""
+        """Stocke un embedding dans le cache (évince le moins récent au-delà de QUERY_CACHE_SIZE)"""
         if self.enable_cache and self.embedding_cache is not None:
-            text_hash = hashlib.md5(text.encode()).hexdigest()
-            self.embedding_cache[text_hash] = embedding
+            self.embedding_cache[self._cache_key(text)] = embedding
+            if len(self.embedding_cache) > QUERY_CACHE_SIZE:
+                self.embedding_cache.popitem(last=False)
 
     def _load_models(self):
         try:
             # 1. Analyse de Sentiment
-            self.sentiment_pipeline = pipeline(
-                "sentiment-analysis",
-                model="cardiffnlp/twitter-roberta-base-sentiment-latest",
-                device=-1,
-                truncation=True,
-                max_length=512
-            )
+            self.sentiment_pipeline = get_sentiment_pipeline()
             # 2. Modèle de similarité Biochimique
             logger.info(f"🧪 Chargement du modèle scientifique : {self.model_name}")
-            self.similarity_model = SentenceTransformer(self.model_name)
-            self.similarity_model.max_seq_length = 512
+            self.similarity_model = get_similarity_model(self.model_name)
             logger.info("✅ Modèles IA chargés avec succès.")
         except Exception as e:
             logger.error(f"❌ Erreur chargement modèles: {e}")
             # Fallback en cas d'erreur
-            self.similarity_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.similarity_model = get_similarity_model('all-MiniLM-L6-v2')
+
+    def _use_encoder(self, backend: str):
+        """Aligne l'encodeur des requêtes sur celui qui a construit l'index chargé.
+
+        ValueError si c'est impossible : l'appelant doit alors reconstruire l'index.
+        """
+        if encoder_backend(self.similarity_model) == backend:
+            return
+        try:
+            self.similarity_model = get_similarity_model(self.model_name, backend)
+        except Exception as e:
+            raise ValueError(f"index construit avec l'encodeur {backend}, indisponible ici ({e})")
+        logger.info(f"🔁 Requêtes encodées avec {backend} (encodeur de l'index).")
 
     def clean_and_weight_ingredients(self, text: str) -> str:
         """
         Nettoie la liste INCI pour l'analyse vectorielle.
         SciBERT préfère une liste propre sans répétition artificielle.
         """
-        if not text or pd.isna(text): 
+        # pd.isna d'abord : `not pd.NA` (colonnes "string") lève une TypeError
+        if text is None or pd.isna(text) or not text: 
             return "unknown"
         
         text = str(text).lower()
         
         # 1. Normalisation des synonymes fréquents (Standardisation)
-        replacements = {
-            'aqua': 'water', 'eau': 'water', 
-            'parfum': 'fragrance',
-            'alcohol denat.': 'alcohol',
-            'l-ascorbic acid': 'ascorbic acid', # Vitamin C
-            'tocopherol': 'vitamin e'
-        }
-        for old, new in replacements.items():
-            text = text.replace(old, new)
+        text = INCI_SYNONYM_RE.sub(_inci_synonym, text)
             
         # 2. Suppression des concentrations (ex: 10%, 2.5%)
-        text = re.sub(r'\d+(\.\d+)?%', '', text)
-        
-        # 3. Découpage
-        parts = [p.strip() for p in text.split(',')]
+        text = INCI_CONCENTRATION_RE.sub('', text)
         
-        # 4. Nettoyage Regex : On garde lettres, chiffres, tirets et parenthèses (chimie)
-        parts = [re.sub(r'[^a-z0-9 /()+-]', '', p) for p in parts]
-        
-        # 5. Filtrage du "bruit" (ingrédients neutres ultra-fréquents)
-        noise = {'water', 'glycerin', 'glycerine', 'phenoxyethanol', 'alcohol'}
-        cleaned = [p.strip() for p in parts if p.strip() not in noise and len(p) > 2]
-        
-        if not cleaned: return "unknown"
+        # 3-5. Découpage, nettoyage regex (chimie), filtrage du "bruit"
+        return _join_inci_parts(text)
 
-        # Note: Pour SciBERT, on évite la duplication (poids * 2) car le modèle
-        # comprend le contexte global de la formule.
-        return " ".join(cleaned)
+    @staticmethod
+    def clean_ingredients_column(ingredients: pd.Series) -> List[str]:
+        """clean_and_weight_ingredients sur toute une colonne : synonymes et concentrations
+        en passes str vectorisées, découpage/filtrage en un seul map."""
+        values = ingredients.astype(object)
+        missing = (values.isna() | (values == '')).to_numpy()
+        text = (values.where(~missing, '').astype(str).str.lower()
+                .str.replace(INCI_SYNONYM_RE, _inci_synonym, regex=True)
+                .str.replace(INCI_CONCENTRATION_RE, '', regex=True))
+        cleaned = text.map(_join_inci_parts).to_numpy()
+        cleaned[missing] = "unknown"
+        return cleaned.tolist()
 
     def detect_categories(self, product_name: str, ingredients: str = "") -> Tuple[str, str]:
         """Identifie la catégorie primaire et secondaire par analyse sémantique et regex."""
         text = f"{product_name} {ingredients}".lower()
         
         # Détection Primaire
-        primary = "Skincare"
-        if re.search(r'\b(shampoo|conditioner|hair|cheveux|scalp)\b', text):
-            primary = "Haircare"
-        elif re.search(r'\b(foundation|makeup|maquillage|lipstick|mascara)\b', text):
-            primary = "Makeup"
-        elif re.search(r'\b(shower gel|body wash|savon|soap|body)\b', text):
-            primary = "Bodycare"
-        elif re.search(r'\b(parfum|perfume|fragrance|scent)\b', text):
-            primary = "Fragrance"
+        primary = next((label for label, pattern in PRIMARY_PATTERNS if pattern.search(text)), "Skincare")
 
         # Détection Secondaire (Type de produit)
-        secondary_patterns = {
-            'cream': r'\b(cream|crème|moisturizer|hydratant|lotion|balm|baume)\b',
-            'serum': r'\b(serum|sérum|concentrate|concentré|ampoule)\b',
-            'cleanser': r'\b(cleanser|nettoyant|wash|gel nettoyant|mousse|micellar)\b',
-            'toner': r'\b(toner|tonique|lotion tonique)\b',
-            'mask': r'\b(mask|masque|patch)\b',
-            'sunscreen': r'\b(sunscreen|spf|écran|solaire|uv)\b',
-            'oil': r'\b(oil|huile)\b',
-            'scrub': r'\b(scrub|gommage|exfoliant|peeling)\b'
-        }
-        
-        secondary = 'unknown'
-        for s_type, pattern in secondary_patterns.items():
-            if re.search(pattern, text):
-                secondary = s_type
-                break
+        secondary = next((s_type for s_type, pattern in SECONDARY_PATTERNS if pattern.search(text)), 'unknown')
+        return primary, secondary
+
+    @staticmethod
+    def _detect_categories_frame(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Version colonne de detect_categories : un str.contains par motif, priorités via np.select."""
+        text = df['product_name'].astype(str).str.cat(df['ingredients'].astype(str), sep=' ').str.lower()
+        # Dtype objet : moteur `re` de Python (\b Unicode, comme detect_categories)
+        text = text.astype(object)
+
+        def masks(patterns):
+            return [text.str.contains(pattern, regex=True, na=False).to_numpy() for _, pattern in patterns]
+
+        primary = np.select(masks(PRIMARY_PATTERNS), [label for label, _ in PRIMARY_PATTERNS],
+                            default="Skincare")
+        secondary = np.select(masks(SECONDARY_PATTERNS), [label for label, _ in SECONDARY_PATTERNS],
+                              default='unknown')
         return primary, secondary
 
     def load_and_vectorize_data(self, df: pd.DataFrame):
         """Prépare le dataset et calcule les embeddings pour la recherche."""
         logger.info(f"⚙️ Préparation de {len(df)} produits avec SciBERT...")
-        self.products_df_indexed = df.reset_index(drop=True).copy()
+        # reset_index renvoie déjà un nouveau DataFrame : pas de .copy() supplémentaire
+        self.products_df_indexed = df.reset_index(drop=True)
         
         # Assurer que les colonnes existent
         for col in ['product_name', 'ingredients', 'brand_name']:
             if col not in self.products_df_indexed.columns:
                 self.products_df_indexed[col] = ''
 
-        # Calcul automatique des catégories
-        cats = self.products_df_indexed.apply(lambda r: self.detect_categories(
-            str(r.get('product_name', '')), 
-            str(r.get('ingredients', ''))
-        ), axis=1)
-        self.products_df_indexed['primary_category'] = [c[0] for c in cats]
-        self.products_df_indexed['secondary_category'] = [c[1] for c in cats]
+        # Calcul automatique des catégories (masques par motif sur toute la colonne)
+        df_idx = self.products_df_indexed
+        primary, secondary = self._detect_categories_frame(df_idx)
+        # Catégories en Categorical par hachage (factorize), sans tri des valeurs uniques
+        for col, values in (('primary_category', primary), ('secondary_category', secondary)):
+            codes, uniques = pd.factorize(np.asarray(values, dtype=object), sort=False)
+            df_idx[col] = pd.Categorical.from_codes(codes, uniques)
         
         # Calcul des vecteurs sémantiques
-        texts_to_embed = self.products_df_indexed['ingredients'].apply(
-            self.clean_and_weight_ingredients
-        ).tolist()
+        texts_to_embed = self.clean_ingredients_column(self.products_df_indexed['ingredients'])
         
-        self.product_embeddings = self.similarity_model.encode(
-            texts_to_embed, 
-            convert_to_tensor=True, 
-            show_progress_bar=True, 
+        self.product_embeddings = self._encode_corpus(texts_to_embed)
+        self._build_lookup_columns()
+        self._build_search_index()
+        self._build_category_index()
+        self._build_token_index()
+        logger.info("✅ Indexation biochimique terminée.")
+
+    def _build_lookup_columns(self):
+        """Colonnes minuscules précalculées pour les recherches par sous-chaîne (regex=False)."""
+        df = self.products_df_indexed
+        df['_brand_lower'] = df['brand_name'].astype('string').str.lower()
+        df['_product_lower'] = df['product_name'].astype('string').str.lower()
+        if 'price_usd' in df.columns:
+            prices = df['price_usd']
+            # Déjà typé au parsing (float32, cf. init_engine.read_products) : pas de seconde conversion
+            if not pd.api.types.is_numeric_dtype(prices):
+                prices = pd.to_numeric(prices, errors='coerce')
+            self.product_prices = prices.to_numpy(dtype=np.float32, na_value=0)
+        else:
+            self.product_prices = np.zeros(len(df), dtype=np.float32)
+
+    def _encode_corpus(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Encode le catalogue lot par lot dans un buffer FP32 préalloué (N×D).
+
+        Les textes sont triés par longueur (moins de padding par lot) ; chaque lot est écrit
+        directement à ses lignes d'origine, sans liste de tenseurs à empiler à la fin.
+        """
+        order = np.argsort(np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts)),
+                           kind='stable')
+        out = None
+        n_batches = (len(texts) + batch_size - 1) // batch_size
+        for b, start in enumerate(range(0, len(texts), batch_size)):
+            rows = order[start:start + batch_size]
+            emb = self.similarity_model.encode([texts[i] for i in rows], batch_size=batch_size,
+                                               normalize_embeddings=True)
+            emb = np.asarray(emb, dtype=np.float32)
+            if out is None:
+                out = np.empty((len(texts), emb.shape[1]), dtype=np.float32)
+            out[rows] = emb
+            if b % 50 == 0:
+                logger.info(f"🧬 Encodage : lot {b + 1}/{n_batches}")
+        if out is None:
+            dim = self.similarity_model.get_sentence_embedding_dimension() \
+                if hasattr(self.similarity_model, 'get_sentence_embedding_dimension') else 768
+            out = np.empty((0, dim), dtype=np.float32)
+        return out
+
+    def _build_search_index(self, quantized: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """Prépare une copie FP32 contiguë et L2-normalisée des embeddings pour le balayage cosinus."""
+        emb = self.product_embeddings
+        if isinstance(emb, torch.Tensor):
+            emb = emb.detach().cpu().numpy()
+        emb = np.ascontiguousarray(emb, dtype=np.float32)
+        norms = np.linalg.norm(emb, axis=1).astype(np.float32)
+        norms[norms == 0] = 1.0
+        self.product_norms = norms
+        # Vecteurs unitaires : le cosinus se réduit à un simple produit scalaire à la requête.
+        # Normalisation en place quand le buffer est modifiable (pas de seconde matrice N×D)
+        if emb.flags.writeable:
+            np.divide(emb, norms[:, None], out=emb)
+            self.product_embeddings_unit = emb
+        else:
+            self.product_embeddings_unit = np.ascontiguousarray(emb / norms[:, None])
+        # Le tenseur public partage ce même buffer normalisé (une seule copie FP32 en mémoire)
+        self.product_embeddings = torch.from_numpy(self.product_embeddings_unit)
+
+        # Copie int8 (échelle par vecteur) : 4x moins de bande passante par requête
+        if quantized is not None and quantized[0] is not None and len(quantized[0]) == len(emb):
+            self.product_embeddings_i8, self.product_scales = quantized
+        else:
+            self.product_embeddings_i8, self.product_scales = self._quantize_int8(self.product_embeddings_unit)
+        self._build_gpu_index()
+
+    def _build_gpu_index(self):
+        """Copie FP16 des vecteurs unitaires sur le GPU (si CUDA) : GEMV à demi-bande passante."""
+        self.product_embeddings_gpu = None
+        if torch.cuda.is_available() and self.product_embeddings_unit is not None:
+            self.product_embeddings_gpu = torch.from_numpy(
+                np.ascontiguousarray(self.product_embeddings_unit)
+            ).to(device='cuda', dtype=torch.float16)
+
+    @staticmethod
+    def _quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Quantifie chaque ligne en int8 symétrique, retourne (valeurs, échelles)."""
+        matrix = np.atleast_2d(matrix)
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+        return np.ascontiguousarray(quantized), scales.astype(np.float32)
+
+    def _build_category_index(self):
+        """Catégorie secondaire / primaire / couple (primaire, secondaire) -> lignes (int32 triées).
+
+        Les filtres de requête deviennent de simples lectures de dict. Les sous-matrices sont
+        créées à la demande.
+        """
+        df = self.products_df_indexed
+
+        def grouped(keys):
+            groups = df.groupby(keys, sort=False, observed=True).indices
+            return {k: np.asarray(idx, dtype=np.int32) for k, idx in groups.items()}
+
+        self.category_indices = grouped('secondary_category')
+        self.primary_indices = grouped('primary_category') if 'primary_category' in df.columns else {}
+        self.pair_indices = (grouped(['primary_category', 'secondary_category'])
+                             if 'primary_category' in df.columns else {})
+        self.category_embeddings = {}
+
+    def _build_token_index(self):
+        """Index inversé token INCI -> lignes (int32 triées)."""
+        postings = defaultdict(list)
+        for row, text in enumerate(self.products_df_indexed['ingredients'].fillna('').astype(str)):
+            for token in set(INCI_TOKEN_RE.findall(text.lower())):
+                postings[token].append(row)
+        self.token_postings = {t: np.asarray(rows, dtype=np.int32) for t, rows in postings.items()}
+
+    def _token_prefilter(self, text: str) -> Optional[np.ndarray]:
+        """Lignes candidates d'une requête courte, par nombre de tokens INCI partagés.
+
+        Retourne None (pas de pré-filtre) pour les requêtes longues ou sans token connu.
+        """
+        tokens = set(INCI_TOKEN_RE.findall(str(text).lower()))
+        if not tokens or len(tokens) > PREFILTER_MAX_TOKENS:
+            return None
+        lists = [self.token_postings[t] for t in tokens if t in self.token_postings]
+        if not lists:
+            return None
+        # Union des listes de postings, pondérée par le recouvrement
+        overlap = np.bincount(np.concatenate(lists), minlength=len(self.products_df_indexed))
+        rows = np.flatnonzero(overlap)
+        if rows.size > PREFILTER_CANDIDATES:
+            rows = np.sort(rows[_top_k_order(overlap[rows].astype(np.float32), PREFILTER_CANDIDATES)])
+        return rows
+
+    def _category_matrix(self, secondary: str) -> Optional[np.ndarray]:
+        """Sous-matrice unitaire contiguë d'une catégorie, copiée au premier accès seulement.
+
+        Avec un index memmap, seules les pages des catégories réellement interrogées sont lues.
+        """
+        matrix = self.category_embeddings.get(secondary)
+        if matrix is None and secondary in self.category_indices:
+            matrix = np.ascontiguousarray(self.product_embeddings_unit[self.category_indices[secondary]])
+            self.category_embeddings[secondary] = matrix
+        return matrix
+
+    def _covers_catalogue(self, indices: np.ndarray) -> bool:
+        """Vrai si `indices` (lignes distinctes, ordre du catalogue) désigne tout le catalogue."""
+        return indices.size == len(self.product_prices)
+
+    def _cosine_scores(self, query_unit: np.ndarray, indices: np.ndarray,
+                       matrix: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similarité cosinus 1×N entre la requête normalisée et les produits indiqués."""
+        if self.product_embeddings_gpu is not None:
+            return self._gpu_scores(query_unit, indices).float().cpu().numpy()
+        if matrix is None:
+            # Sans filtre : la matrice de base (memmap) est balayée telle quelle, sans copie
+            full = self._covers_catalogue(indices)
+            matrix = self.product_embeddings_unit if full else self.product_embeddings_unit[indices]
+        if SIMSIMD_AVAILABLE:
+            # Un seul appel vectorisé (AVX-512/NEON) pour tout le balayage
+            distances = simsimd.cdist(query_unit[None, :], matrix, metric="cosine")
+            return 1.0 - np.asarray(distances, dtype=np.float32).ravel()
+        if NUMBA_AVAILABLE:
+            # Balayage JIT multi-cœurs (compilé une fois, mis en cache sur disque)
+            scores = np.empty(matrix.shape[0], dtype=np.float32)
+            _cosine_sweep(np.ascontiguousarray(query_unit, dtype=np.float32),
+                          np.ascontiguousarray(matrix), scores)
+            return scores
+        return matrix @ query_unit
+
+    def _gpu_scores(self, query_unit: np.ndarray, indices: np.ndarray) -> torch.Tensor:
+        """Cosinus sur GPU : vecteurs déjà unitaires, donc un seul produit matrice-vecteur (cuBLAS, FP16)."""
+        rows = self.product_embeddings_gpu
+        if not self._covers_catalogue(indices):
+            rows = torch.index_select(rows, 0, torch.as_tensor(indices, dtype=torch.long, device='cuda'))
+        query = torch.from_numpy(query_unit).to(device='cuda', dtype=torch.float16)
+        return torch.mv(rows, query)
+
+    def _rank_candidates(self, query_unit: np.ndarray, indices: np.ndarray, top_k: int,
+                         matrix: Optional[np.ndarray] = None,
+                         quantized: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Retourne (indices produits, scores cosinus) des top_k meilleurs candidats, triés.
+
+        `matrix`, si fourni, contient déjà les embeddings unitaires des lignes `indices`.
+        `quantized` (q_i8, q_scale) évite de re-quantifier une requête préparée.
+        """
+        if self.product_embeddings_gpu is not None:
+            # Top-k directement sur le GPU : seuls k indices/scores reviennent côté CPU
+            top = torch.topk(self._gpu_scores(query_unit, indices), min(top_k, len(indices)))
+            return indices[top.indices.cpu().numpy()], top.values.float().cpu().numpy()
+
+        shortlist_size = max(RERANK_CANDIDATES, top_k)
+        if SIMSIMD_AVAILABLE and self.product_embeddings_i8 is not None and len(indices) > shortlist_size:
+            # Pré-sélection int8 (VNNI / sdot) puis re-classement FP32 exact
+            q_i8, q_scale = quantized if quantized is not None else self._quantize_int8(query_unit)
+            # Sans filtre : matrice int8 et échelles complètes, sans copie indexée
+            if self._covers_catalogue(indices):
+                rows_i8, scales = self.product_embeddings_i8, self.product_scales
+            else:
+                rows_i8, scales = self.product_embeddings_i8[indices], self.product_scales[indices]
+            dots = simsimd.cdist(q_i8, rows_i8, metric="dot")
+            approx = np.asarray(dots, dtype=np.float32).ravel() * (q_scale[0] * scales)
+            shortlist = _top_k_order(approx, shortlist_size)
+            indices = indices[shortlist]
+            if matrix is not None:
+                matrix = matrix[shortlist]
+
+        scores = self._cosine_scores(query_unit, indices, matrix)
+        order = _top_k_order(scores, top_k)
+        return indices[order], scores[order]
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encode plusieurs listes INCI en une seule passe du transformer (embeddings normalisés)."""
+        cleaned = [self.clean_and_weight_ingredients(t) for t in texts]
+        embeddings = self.similarity_model.encode(
+            cleaned,
             normalize_embeddings=True,
             batch_size=32
         )
-        logger.info("✅ Indexation biochimique terminée.")
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        for text, emb in zip(cleaned, embeddings):
+            self._cache_embedding(text, emb)
+        return embeddings
+
+    def prepare_query(self, target_ingredients: str,
+                      query_emb: Optional[np.ndarray] = None,
+                      prefilter: bool = False) -> PreparedQuery:
+        """Encode, normalise et quantifie la requête une fois pour toutes (cache LRU inclus).
+
+        `query_emb` : embedding normalisé déjà calculé (ex. par encode_batch), l'encodage est alors sauté.
+        `prefilter` : restreint le balayage au pré-filtre lexical (approché, désactivé par défaut
+                      pour que tous les chemins de recherche renvoient le même classement exact).
+        """
+        if query_emb is None:
+            cleaned_query = self.clean_and_weight_ingredients(target_ingredients)
+            query_emb = self._get_cached_embedding(cleaned_query)
+        if query_emb is None:
+            query_emb = self.similarity_model.encode(
+                cleaned_query,
+                normalize_embeddings=True
+            )
+            self._cache_embedding(cleaned_query, query_emb)
+
+        unit = np.ascontiguousarray(query_emb, dtype=np.float32).ravel()
+        q_i8, q_scale = self._quantize_int8(unit)
+        candidates = self._token_prefilter(target_ingredients) if prefilter else None
+        return PreparedQuery(unit=unit, q_i8=q_i8, q_scale=q_scale, candidates=candidates)
 
-    def find_similar_products(self, target_ingredients: str, target_price: float = 0, 
-                             top_n: int = 5, primary: Optional[str] = None, 
-                             secondary: Optional[str] = None) -> List[Dict]:
-        """Recherche les dupes par similarité cosinus."""
+    def search_prepared(self, pq: PreparedQuery, target_price: float = 0, top_n: int = 5,
+                        primary: Optional[str] = None, secondary: Optional[str] = None) -> List[Dict]:
+        """Recherche les dupes à partir d'une requête préparée (cf. prepare_query)."""
+        return self.find_similar_by_embedding(pq.unit, target_price, top_n, primary, secondary,
+                                              candidates=pq.candidates,
+                                              quantized=(pq.q_i8, pq.q_scale))
+
+    def search_prepared_arrays(self, pq: PreparedQuery, target_price: float = 0, top_n: int = 5,
+                               primary: Optional[str] = None,
+                               secondary: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Comme search_prepared, mais renvoie les tableaux de find_similar_arrays (row_idx, similarity, price)."""
+        return self.find_similar_arrays(pq.unit, target_price, top_n, primary, secondary,
+                                        candidates=pq.candidates,
+                                        quantized=(pq.q_i8, pq.q_scale))
+
+    def find_similar_products(self, target_ingredients: str, target_price: float = 0,
+                             top_n: int = 5, primary: Optional[str] = None,
+                             secondary: Optional[str] = None,
+                             query_emb: Optional[np.ndarray] = None) -> List[Dict]:
+        """Recherche les dupes par similarité cosinus.
+
+        `query_emb` : embedding déjà calculé (cf. encode_batch), l'encodage est alors sauté.
+        """
         if self.product_embeddings is None:
             logger.warning("Tentative de recherche sur un moteur non initialisé.")
             return []
-        
+
+        return self.search_prepared(self.prepare_query(target_ingredients, query_emb), target_price,
+                                    top_n, primary, secondary)
+
+    def find_similar_products_batch(self, targets: List[str], target_price: float = 0,
+                                    top_n: int = 5, primary: Optional[str] = None,
+                                    secondaries: Optional[List[Optional[str]]] = None) -> List[List[Dict]]:
+        """Plusieurs requêtes : un seul passage du transformer (encode_batch), puis une recherche par requête.
+
+        `secondaries` : catégorie secondaire propre à chaque requête (None = pas de filtre).
+        """
+        if self.product_embeddings is None:
+            logger.warning("Tentative de recherche sur un moteur non initialisé.")
+            return [[] for _ in targets]
+        if not targets:
+            return []
+
+        if secondaries is None:
+            secondaries = [None] * len(targets)
+        query_embs = self.encode_batch(targets)
+        return [self.find_similar_products(target, target_price, top_n, primary, secondary, emb)
+                for target, secondary, emb in zip(targets, secondaries, query_embs)]
+
+    def find_similar_arrays(self, query_emb: np.ndarray, target_price: float = 0,
+                            top_n: int = 5, primary: Optional[str] = None,
+                            secondary: Optional[str] = None,
+                            candidates: Optional[np.ndarray] = None,
+                            quantized: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+        """Variante tableaux de find_similar_by_embedding : {'row_idx', 'similarity', 'price'} triés.
+
+        Permet aux scripts de filtrer les résultats avec des masques NumPy plutôt qu'en Python.
+        `candidates` (lignes triées, cf. _token_prefilter) restreint le balayage cosinus.
+        """
+        if self.product_embeddings is None:
+            logger.warning("Tentative de recherche sur un moteur non initialisé.")
+            return {'row_idx': np.empty(0, dtype=np.intp),
+                    'similarity': np.empty(0, dtype=np.float32),
+                    'price': np.empty(0, dtype=np.float32)}
+
         # 1. Filtres de catégorie (Optionnels mais recommandés pour la précision)
-        mask = pd.Series([True] * len(self.products_df_indexed))
-        if primary and primary != "All":
-            mask &= (self.products_df_indexed['primary_category'] == primary)
-        if secondary and secondary != "unknown":
-            mask &= (self.products_df_indexed['secondary_category'] == secondary)
+        # La catégorie secondaire passe par l'index précalculé : pas de masque O(N)
+        n_products = len(self.products_df_indexed)
+        valid_indices = np.arange(n_products)
+        category_matrix = None
+        no_rows = np.empty(0, dtype=np.int32)
+        use_secondary = bool(secondary) and secondary != "unknown"
+        use_primary = bool(primary) and primary != "All"
+        if use_secondary and use_primary:
+            valid_indices = self.pair_indices.get((primary, secondary), no_rows)
+        elif use_secondary:
+            valid_indices = self.category_indices.get(secondary, no_rows)
+            category_matrix = self._category_matrix(secondary)
+        elif use_primary:
+            valid_indices = self.primary_indices.get(primary, no_rows)
         
         # Filtre Prix (Si spécifié)
         if target_price > 0:
             # On cherche des produits moins chers ou dans une gamme similaire (+/- 50%)
-            price_vals = pd.to_numeric(self.products_df_indexed['price_usd'], errors='coerce').fillna(0)
-            mask &= (price_vals <= (target_price * 1.5))
+            valid_indices = valid_indices[self.product_prices[valid_indices] <= (target_price * 1.5)]
+            category_matrix = None
+
+        # Pré-filtre lexical, ignoré s'il laisse moins de top_n produits
+        if candidates is not None:
+            kept = valid_indices[np.isin(valid_indices, candidates, assume_unique=True)]
+            if kept.size >= top_n:
+                valid_indices = kept
+                category_matrix = None
 
-        valid_indices = self.products_df_indexed.index[mask].tolist()
-        if not valid_indices: 
+        if valid_indices.size == 0: 
             # Si aucun produit ne correspond aux filtres, on cherche dans tout le catalogue
-            valid_indices = self.products_df_indexed.index.tolist()
-        
-        # 2. Gestion du Cache & Encodage Requête
-        cleaned_query = self.clean_and_weight_ingredients(target_ingredients)
-        cached_emb = self._get_cached_embedding(cleaned_query)
-        
-        if cached_emb is not None:
-            query_emb = cached_emb
-        else:
-            query_emb = self.similarity_model.encode(
-                cleaned_query, 
-                convert_to_tensor=True, 
-                normalize_embeddings=True
-            )
-            self._cache_embedding(cleaned_query, query_emb)
-        
-        # 3. Calcul de Similarité (Cosinus)
-        filtered_embs = self.product_embeddings[valid_indices]
-        cos_scores = util.cos_sim(query_emb, filtered_embs)[0]
+            valid_indices = np.arange(n_products)
+            category_matrix = None
+
+        query_unit = np.ascontiguousarray(query_emb, dtype=np.float32).ravel()
         
-        # Récupération du Top K
-        actual_top_k = min(top_n, len(valid_indices))
-        top_results = torch.topk(cos_scores, k=actual_top_k)
+        # 2. Calcul de Similarité (Cosinus) + Top K
+        top_indices, top_scores = self._rank_candidates(query_unit, valid_indices, top_n,
+                                                        category_matrix, quantized)
+        return {
+            'row_idx': top_indices,
+            'similarity': top_scores,
+            'price': self.product_prices[top_indices],
+        }
+
+    def find_similar_by_embedding(self, query_emb: np.ndarray, target_price: float = 0,
+                                  top_n: int = 5, primary: Optional[str] = None,
+                                  secondary: Optional[str] = None,
+                                  candidates: Optional[np.ndarray] = None,
+                                  quantized: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> List[Dict]:
+        """Recherche les dupes à partir d'un embedding de requête déjà calculé (cf. encode_batch)."""
+        if self.product_embeddings is None:
+            logger.warning("Tentative de recherche sur un moteur non initialisé.")
+            return []
+
+        hits = self.find_similar_arrays(query_emb, target_price, top_n, primary, secondary,
+                                        candidates, quantized)
+        top_indices, top_scores = hits['row_idx'], hits['similarity']
 
         results = []
-        for score, local_idx in zip(top_results.values, top_results.indices):
-            idx = valid_indices[local_idx.item()]
+        for idx, score in zip(top_indices, top_scores):
             product = self.products_df_indexed.iloc[idx]
             
             # Conversion sécurisée du prix
@@ -257,7 +861,7 @@ class PureSkinNLPEngine:
                 'product_name': str(product.get('product_name', '')),
                 'brand_name': str(product.get('brand_name', '')),
                 'price': price,
-                'similarity': round(float(score.item()), 3),
+                'similarity': round(float(score), 3),
                 'secondary_category': product.get('secondary_category', 'unknown'),
                 'rating': float(product.get('rating', 0) or 0),
                 'reviews': int(product.get('reviews', 0) or 0),
@@ -298,13 +902,9 @@ class PureSkinNLPEngine:
     def analyze_ingredients_safety(self, ingredients: str) -> Dict:
         """Analyse basique des risques."""
         ing_lower = str(ingredients).lower()
-        hazards = {
-            "comedogenic": ['isopropyl myristate', 'coconut oil', 'sodium chloride', 'lanolin'],
-            "irritants": ['fragrance', 'parfum', 'alcohol denat', 'menthol', 'linalool'],
-            "check_list": ['paraben', 'sulfate', 'phthalate', 'formaldehyde']
-        }
-        
-        found = {cat: [i for i in lst if i in ing_lower] for cat, lst in hazards.items()}
+        # Un seul balayage du texte ; chaque terme n'est listé qu'une fois, dans l'ordre de HAZARDS
+        matched = {m.group() for m in HAZARD_RE.finditer(ing_lower)}
+        found = {cat: [i for i in lst if i in matched] for cat, lst in HAZARDS.items()}
         total_hazards = sum(len(v) for v in found.values())
         
         score = "Excellent" if total_hazards == 0 else "Good" if total_hazards <= 2 else "Caution"
@@ -322,37 +922,136 @@ class PureSkinNLPEngine:
             if mask.any():
                 df = df[mask]
             
-        return df.sort_values(by=['rating', 'reviews'], ascending=False).head(10).to_dict('records')
+        # Les colonnes internes (préfixe "_") ne sont pas exposées
+        public_cols = [c for c in df.columns if not c.startswith('_')]
+        # Tri sur les deux seules colonnes de clé, puis projection des 10 lignes retenues
+        top_rows = df[['rating', 'reviews']].sort_values(by=['rating', 'reviews'], ascending=False).index[:10]
+        top = df.loc[top_rows, public_cols]
+        return [dict(zip(public_cols, row)) for row in top.itertuples(index=False, name=None)]
 
     def analyze_review(self, text: str, skin_type: str = "all") -> Dict:
         """Analyse de sentiment pour les avis."""
+        return self.analyze_reviews([text], skin_type)[0]
+
+    def analyze_reviews(self, texts: List[str], skin_type: str = "all") -> List[Dict]:
+        """Analyse de sentiment d'un lot d'avis en un appel du pipeline (batching natif).
+
+        Les avis sont triés par longueur avant l'inférence (moins de padding par lot), puis
+        les résultats sont remis dans l'ordre d'origine.
+        """
+        if not texts:
+            return []
         try:
-            res = self.sentiment_pipeline(text[:512])[0]
-            return {
-                "sentiment": res['label'],
-                "confidence": round(res['score'], 3),
-                "skin_type_mentioned": skin_type if skin_type in text.lower() else "none"
-            }
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            outputs = self.sentiment_pipeline([texts[i][:512] for i in order], batch_size=16,
+                                              truncation=True, max_length=512)
+            results = [None] * len(texts)
+            for i, res in zip(order, outputs):
+                results[i] = {
+                    "sentiment": res['label'],
+                    "confidence": round(res['score'], 3),
+                    "skin_type_mentioned": skin_type if skin_type in texts[i].lower() else "none"
+                }
+            return results
         except:
-            return {"sentiment": "NEUTRAL", "confidence": 0.0}
+            return [{"sentiment": "NEUTRAL", "confidence": 0.0} for _ in texts]
+
+    @staticmethod
+    def _index_paths(path: str) -> Dict[str, str]:
+        """Fichiers de l'index persistant, dérivés du nom logique (ex: pure_skin_engine.pt)."""
+        base = os.path.splitext(path)[0]
+        return {
+            'meta': f"{base}.json",
+            'df': f"{base}_df.pkl",
+            'df_arrow': f"{base}_df.arrow",
+            'emb': f"{base}_emb.f32",
+            'emb_i8': f"{base}_emb.i8",
+            'scales': f"{base}_scales.f32",
+        }
 
     def save_engine(self, path: str = "pure_skin_engine.pt"):
-        data = {
-            'embeddings': self.product_embeddings, 
-            'df': self.products_df_indexed,
-            'config': {'model': self.model_name}
+        """Écrit les matrices en binaire brut (lisibles par np.memmap) + métadonnées légères."""
+        paths = self._index_paths(path)
+        unit = self.product_embeddings_unit
+        unit.tofile(paths['emb'])
+        self.product_embeddings_i8.tofile(paths['emb_i8'])
+        np.asarray(self.product_scales, dtype=np.float32).tofile(paths['scales'])
+        df = self.products_df_indexed.drop(
+            columns=[c for c in self.products_df_indexed.columns if c.startswith('_')]
+        )
+        if PYARROW_AVAILABLE:
+            # Arrow IPC non compressé : relu par memory-map, sans désérialisation ni copie des chaînes
+            feather.write_feather(df, paths['df_arrow'], compression='uncompressed')
+            df_format = 'arrow'
+        else:
+            df.to_pickle(paths['df'])
+            df_format = 'pickle'
+        meta = {
+            'shape': list(unit.shape),
+            'dtype': str(unit.dtype),
+            'i8_dtype': str(self.product_embeddings_i8.dtype),
+            'df_format': df_format,
+            'config': {'model': self.model_name,
+                       'encoder': encoder_backend(self.similarity_model)},
         }
-        torch.save(data, path)
-        logger.info(f"💾 Moteur sauvegardé vers {path}")
+        # Métadonnées écrites en dernier : leur présence signale un index complet
+        with open(paths['meta'], 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        logger.info(f"💾 Moteur sauvegardé vers {paths['meta']} (+ matrices memmap)")
 
     def load_engine(self, path: str = "pure_skin_engine.pt"):
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        paths = self._index_paths(path)
         try:
-            # Note: weights_only=False nécessaire pour charger des DataFrames pandas stockés
-            data = torch.load(path, map_location=device, weights_only=False)
-            self.product_embeddings = data['embeddings']
-            self.products_df_indexed = data['df']
+            if os.path.exists(paths['meta']):
+                self._load_memmap_index(paths)
+            else:
+                self._load_legacy_engine(path)
             logger.info(f"📂 Moteur chargé avec {len(self.products_df_indexed)} produits.")
         except Exception as e:
             logger.error(f"❌ Erreur chargement : {e}")
-            raise e
\ No newline at end of file
+            raise e
+
+    def _load_memmap_index(self, paths: Dict[str, str]):
+        """Projette les matrices en mémoire : l'OS ne lit que les pages touchées par les requêtes."""
+        with open(paths['meta'], encoding='utf-8') as f:
+            meta = json.load(f)
+        # Index sans encodeur enregistré : impossible de garantir la cohérence des scores
+        encoder = meta.get('config', {}).get('encoder')
+        if encoder is None:
+            raise ValueError("encodeur de l'index non enregistré, reconstruction nécessaire")
+        self._use_encoder(encoder)
+        shape = tuple(meta['shape'])
+        if meta.get('df_format') == 'arrow':
+            table = feather.read_table(paths['df_arrow'], memory_map=True)
+            self.products_df_indexed = table.to_pandas(
+                split_blocks=True,
+                types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get,
+            )
+        else:
+            self.products_df_indexed = pd.read_pickle(paths['df'])
+        self.product_embeddings_unit = np.memmap(paths['emb'], dtype=meta['dtype'], mode='r', shape=shape)
+        # Vue copy-on-write du même fichier pour l'API tenseur (.cpu().numpy()) sans lecture complète
+        self.product_embeddings = torch.from_numpy(
+            np.memmap(paths['emb'], dtype=meta['dtype'], mode='c', shape=shape)
+        )
+        self.product_norms = np.ones(shape[0], dtype=np.float32)
+        self.product_embeddings_i8 = np.memmap(paths['emb_i8'], dtype=meta['i8_dtype'], mode='r', shape=shape)
+        self.product_scales = np.fromfile(paths['scales'], dtype=np.float32)
+        self._build_gpu_index()
+        self._build_lookup_columns()
+        self._build_category_index()
+        self._build_token_index()
+
+    def _load_legacy_engine(self, path: str):
+        """Ancien format torch.save (.pt), chargé intégralement en RAM."""
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # Note: weights_only=False nécessaire pour charger des DataFrames pandas stockés
+        data = torch.load(path, map_location=device, weights_only=False)
+        # Ancien format : toujours construit avec SentenceTransformer (PyTorch FP32)
+        self._use_encoder(ENCODER_TORCH_FP32)
+        self.product_embeddings = data['embeddings']
+        self.products_df_indexed = data['df']
+        self._build_lookup_columns()
+        self._build_search_index(quantized=(data.get('embeddings_i8'), data.get('scales')))
+        self._build_category_index()
+        self._build_token_index()
@@ -1,9 +1,11 @@
 # ocr_service.py
 # Version: 7.3 - Geometric Strict (Zone Top = Brand, Zone Mid = Product)
 
+import io
 import os
 import re
 import shutil
+import heapq
 from difflib import SequenceMatcher
 from typing import Dict, List, Tuple, Optional
 import pandas as pd
@@ -11,6 +13,18 @@ import pytesseract
 from PIL import Image, ImageEnhance, ImageFilter, ImageOps
 import numpy as np
 
+try:
+    from rapidfuzz import fuzz, process
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
 # =========================
 # 0) CONFIGURATION
 # =========================
@@ -35,6 +49,9 @@ def _setup_tesseract() -> bool:
 
 _setup_tesseract()
 
+# Borne anti "decompression bomb" : PIL lève une erreur au-delà (≈ 6000 x 6000)
+Image.MAX_IMAGE_PIXELS = 36_000_000
+
 # =========================
 # 1) CHARGEMENT DB
 # =========================
@@ -62,21 +79,62 @@ def norm(s: str) -> str:
     if not isinstance(s, str): return ""
     return re.sub(r"[^a-z0-9]", "", s.lower())
 
+# Noms / marques normalisés une fois au chargement (et non à chaque requête).
+# Marques encodées en dictionnaire : codes par ligne + marques uniques normalisées
+NAMES_NORM = DF[COL_PRODUCT].astype(str).map(norm).to_numpy() if COL_PRODUCT else np.array([], dtype=object)
+if COL_BRAND:
+    BRAND_CODES, _brand_uniques = pd.factorize(DF[COL_BRAND].astype(str))
+    BRAND_VALUES_NORM = pd.Series(_brand_uniques).map(norm)
+else:
+    BRAND_CODES, BRAND_VALUES_NORM = np.array([], dtype=np.intp), pd.Series(dtype=object)
+
 # Mots à ignorer absolument (Bruit)
 NOISE_WORDS = {"ml", "fl", "oz", "net", "wt", "vol", "paris", "london", "new", "york", "usa", "made", "in"}
+# Un mot entier (\w+) de NOISE_WORDS, trouvé en une seule recherche compilée par ligne
+NOISE_RE = re.compile(r'(?<!\w)(?:' + '|'.join(sorted(map(re.escape, NOISE_WORDS), key=len, reverse=True)) + r')(?!\w)')
 
 # =========================
 # 3) PRE-TRAITEMENT IMAGE
 # =========================
+# Hauteur fixe de travail : repères de position stables
+TARGET_HEIGHT = 2000
+# Taille minimale conservée au décodage (draft) : les deux côtés restent >= TARGET_HEIGHT,
+# quelle que soit la rotation, pour ne jamais ré-agrandir une image réduite au décodage
+DECODE_MIN_SIZE = (TARGET_HEIGHT, TARGET_HEIGHT)
+
+def _preprocess_cv2(image: Image.Image) -> Image.Image:
+    """Même chaîne que preprocess_image, en OpenCV (SIMD, GIL relâché), sur un seul canal."""
+    # Niveaux de gris avant le redimensionnement : 3x moins de pixels à interpoler
+    gray = cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+    new_width = int(gray.shape[1] * TARGET_HEIGHT / gray.shape[0])
+    gray = cv2.resize(gray, (new_width, TARGET_HEIGHT), interpolation=cv2.INTER_LANCZOS4)
+
+    # Amélioration contraste (ImageEnhance.Contrast(2.0) : mean + 2 * (px - mean), saturé)
+    mean = int(cv2.mean(gray)[0] + 0.5)
+    gray = cv2.addWeighted(gray, 2.0, gray, 0.0, -mean)
+
+    # Netteté (UnsharpMask radius=2, percent=150, threshold=3)
+    blurred = cv2.GaussianBlur(gray, (0, 0), 2)
+    sharpened = cv2.addWeighted(gray, 2.5, blurred, -1.5, 0)
+    low_diff = cv2.absdiff(gray, blurred) < 3
+    sharpened[low_diff] = gray[low_diff]
+
+    # Si l'image est très sombre (fond noir), on inverse
+    if cv2.mean(sharpened)[0] < 100:
+        cv2.bitwise_not(sharpened, dst=sharpened)
+    return Image.fromarray(sharpened)
+
 def preprocess_image(image: Image.Image) -> Image.Image:
     """Standardise l'image pour que les calculs de position soient fiables"""
+    if CV2_AVAILABLE:
+        return _preprocess_cv2(image)
+
     img = image.convert("RGB")
     
     # On redimensionne à une hauteur fixe (2000px) pour avoir des repères stables
-    target_height = 2000
-    ratio = target_height / img.height
+    ratio = TARGET_HEIGHT / img.height
     new_width = int(img.width * ratio)
-    img = img.resize((new_width, target_height), Image.Resampling.LANCZOS)
+    img = img.resize((new_width, TARGET_HEIGHT), Image.Resampling.LANCZOS)
     
     gray = img.convert("L")
     
@@ -88,10 +146,8 @@ def preprocess_image(image: Image.Image) -> Image.Image:
     gray = gray.filter(ImageFilter.UnsharpMask(radius=2, percent=150, threshold=3))
 
     # Si l'image est très sombre (fond noir), on inverse
-    stat = ImageOps.grayscale(img).getextrema()
-    # Calculer la moyenne des pixels
-    np_img = np.array(gray)
-    if np.mean(np_img) < 100: # Image sombre
+    # Moyenne des pixels en une réduction NumPy (tableau lecture seule, pas de copie modifiable)
+    if np.asarray(gray).mean() < 100: # Image sombre
         gray = ImageOps.invert(gray)
 
     return gray
@@ -110,49 +166,37 @@ def get_lines_with_geometry(image: Image.Image) -> List[Dict]:
         # Fallback si tesseract plante
         return []
 
-    lines = {}
-    n_boxes = len(data['text'])
-    
-    for i in range(n_boxes):
-        text = data['text'][i].strip()
-        conf = int(data['conf'][i])
-        
-        if not text or conf < 40: continue
-        
-        # On groupe par ligne (Block + Ligne)
-        key = (data['block_num'][i], data['line_num'][i])
-        
-        if key not in lines:
-            lines[key] = {
-                'text_parts': [],
-                'y': data['top'][i],       # Position Y (Haut -> Bas)
-                'h': data['height'][i],    # Taille de la police
-                'w': data['width'][i]
-            }
-        
-        lines[key]['text_parts'].append(text)
-        # On garde la hauteur max de la ligne (taille de police)
-        lines[key]['h'] = max(lines[key]['h'], data['height'][i])
+    # Colonnes Tesseract en une frame : filtrage par masques, regroupement en une passe C
+    words = pd.DataFrame({k: data[k] for k in ('text', 'conf', 'block_num', 'line_num', 'top', 'height', 'width')})
+    words['text'] = words['text'].astype(str).str.strip()
+    conf = pd.to_numeric(words['conf'], errors='coerce').fillna(-1).astype(int)
+    words = words[(words['text'] != '') & (conf >= 40)]
+    if words.empty:
+        return []
+
+    # On groupe par ligne (Block + Ligne), dans l'ordre de lecture
+    # y / w : premier mot de la ligne ; h : hauteur max de la ligne (taille de police)
+    grouped = words.groupby(['block_num', 'line_num'], sort=False).agg(
+        text_parts=('text', list), y=('top', 'first'), h=('height', 'max'), w=('width', 'first')
+    )
+    grouped['full_text'] = grouped['text_parts'].str.join(' ').str.strip()
+    grouped = grouped[grouped['full_text'].str.len() >= 3]
 
-    # Consolidation
-    final_lines = []
+    # Calcul de la position relative (0.0 = Tout en haut, 1.0 = Tout en bas)
     img_height = processed.height # Devrait être 2000
-    
-    for k, v in lines.items():
-        full_text = " ".join(v['text_parts']).strip()
-        if len(full_text) < 3: continue
-        
-        # Calcul de la position relative (0.0 = Tout en haut, 1.0 = Tout en bas)
-        rel_y = v['y'] / img_height
-        
-        final_lines.append({
+    rel_y = (grouped['y'] / img_height).to_numpy()
+
+    # Consolidation : dicts Python construits seulement à la sortie
+    return [
+        {
             'text': full_text,
-            'rel_y': rel_y,      # Position relative
-            'font_size': v['h'], # Taille police
-            'raw': v
-        })
-        
-    return final_lines
+            'rel_y': float(ry),  # Position relative
+            'font_size': int(h), # Taille police
+            'raw': {'text_parts': parts, 'y': int(y), 'h': int(h), 'w': int(w)}
+        }
+        for full_text, ry, parts, y, h, w in zip(grouped['full_text'], rel_y, grouped['text_parts'],
+                                                  grouped['y'], grouped['h'], grouped['w'])
+    ]
 
 def analyze_layout_strict(lines: List[Dict]) -> Dict:
     """
@@ -166,8 +210,7 @@ def analyze_layout_strict(lines: List[Dict]) -> Dict:
     # Filtrage du bruit (Volume, etc.)
     clean_lines = []
     for l in lines:
-        words = set(re.findall(r'\w+', l['text'].lower()))
-        if words.intersection(NOISE_WORDS): continue # C'est du bruit (50ml etc)
+        if NOISE_RE.search(l['text'].lower()): continue # C'est du bruit (50ml etc)
         clean_lines.append(l)
 
     # 1. Remplir les zones
@@ -190,18 +233,14 @@ def analyze_layout_strict(lines: List[Dict]) -> Dict:
 
     # 2. Sélection MARQUE
     # On prend le candidat avec le meilleur score dans la zone haute
-    brand_candidates.sort(key=lambda x: x['score'], reverse=True)
+    # (max : une passe, premier ex-aequo conservé comme avec le tri stable)
     best_brand = "Unknown"
     if brand_candidates:
-        best_brand = brand_candidates[0]['text']
+        best_brand = max(brand_candidates, key=lambda x: x['score'])['text']
 
     # 3. Sélection PRODUIT
-    # On prend les 2 lignes les plus grosses dans la zone milieu
-    product_candidates.sort(key=lambda x: x['score'], reverse=True)
-    
-    best_product_parts = []
-    for pc in product_candidates[:2]: # Max 2 lignes pour le nom
-        best_product_parts.append(pc['text'])
+    # On prend les 2 lignes les plus grosses dans la zone milieu (sélection partielle, sans tri complet)
+    best_product_parts = [pc['text'] for pc in heapq.nlargest(2, product_candidates, key=lambda x: x['score'])]
     
     best_product = " ".join(best_product_parts) if best_product_parts else "Unknown Product"
 
@@ -225,31 +264,39 @@ def find_in_db_fuzzy(brand: str, product: str) -> Dict:
     if DF.empty: return {"found": False}
     
     # 1. Filtrer par marque (si trouvée)
-    subset = DF
+    rows = np.arange(len(DF))
     if brand != "Unknown" and COL_BRAND:
         brand_norm = norm(brand)
         # On cherche une marque qui ressemble dans la DB
         # Astuce : on vérifie si les 4 premiers caractères matchent pour filtrer vite
-        mask = DF[COL_BRAND].astype(str).apply(norm).str.contains(brand_norm[:4], regex=False)
+        # Test sur les seules marques distinctes, diffusé aux lignes par les codes
+        mask = BRAND_VALUES_NORM.str.contains(brand_norm[:4], regex=False).to_numpy()[BRAND_CODES]
         if mask.any():
-            subset = DF[mask]
+            rows = np.flatnonzero(mask)
 
     # 2. Chercher le produit dans ce subset
-    best_score = 0
-    best_row = None
     product_norm = norm(product)
-
-    for idx, row in subset.iterrows():
-        db_name = norm(str(row[COL_PRODUCT]))
-        # Similarité sur le nom du produit
-        score = SequenceMatcher(None, product_norm, db_name).ratio()
-        
-        if score > best_score:
-            best_score = score
-            best_row = row
+    names = NAMES_NORM[rows]
 
     threshold = 0.45 # Seuil tolérant car l'OCR peut faire des erreurs
+    if RAPIDFUZZ_AVAILABLE:
+        # Meilleur candidat en un appel C++ (même normalisation 2*M/T que SequenceMatcher) ;
+        # le seuil sert de score_cutoff : les candidats trop éloignés sont abandonnés tôt
+        match = process.extractOne(product_norm, names, scorer=fuzz.ratio, score_cutoff=threshold * 100)
+        best_score, best_pos = (match[1] / 100, match[2]) if match is not None else (0, -1)
+    else:
+        best_score = 0
+        best_pos = -1
+        for pos, name in enumerate(names):
+            # Similarité sur le nom du produit
+            score = SequenceMatcher(None, product_norm, name).ratio()
+
+            if score > best_score:
+                best_score = score
+                best_pos = pos
+
     if best_score > threshold:
+        best_row = DF.iloc[rows[best_pos]]
         return {
             "found": True,
             "product_name": best_row[COL_PRODUCT],
@@ -294,4 +341,18 @@ def extract_product_info_enhanced(image: Image.Image, debug_mode: bool = False)
         return result
 
     except Exception as e:
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+        return {"success": False, "error": str(e)}
+
+def extract_product_info_from_bytes(image_bytes: bytes, debug_mode: bool = False) -> Dict:
+    """Décodage PIL + OCR à partir des octets bruts (point d'entrée picklable pour un pool de processus)."""
+    # Contrôle de structure sans décodage des pixels ; verify() invalide l'objet, on rouvre ensuite
+    try:
+        Image.open(io.BytesIO(image_bytes)).verify()
+    except Exception:
+        return {"success": False, "error": "Image invalide ou trop grande"}
+    image = Image.open(io.BytesIO(image_bytes))
+    # JPEG : décodage directement à l'échelle 1/2, 1/4 ou 1/8 (sans image pleine taille en mémoire),
+    # seulement si l'image reste au moins à la hauteur de travail
+    image.draft("RGB", DECODE_MIN_SIZE)
+    image = image.convert("RGB")
+    return extract_product_info_enhanced(image, debug_mode=debug_mode)
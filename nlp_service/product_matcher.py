@@ -1,9 +1,15 @@
+import hashlib
 import os
 import re
 import shutil
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from difflib import SequenceMatcher
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional
 
+import numpy as np
 import pandas as pd
 from PIL import Image, ImageFilter, ImageOps, ImageEnhance
 
@@ -13,22 +19,53 @@ try:
 except ImportError:
     TESSERACT_AVAILABLE = False
 
+try:
+    import tesserocr  # libtesseract en processus : pas de fork ni de rechargement du modèle par appel
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+try:
+    from rapidfuzz import fuzz, process
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
 
 # =========================================================
 # CONFIG
 # =========================================================
+# Présélection rapidfuzz : lignes gardées par candidat avant le scoring SequenceMatcher
+FUZZY_SHORTLIST = 20
+
+# Appels Tesseract en parallèle (le GIL est relâché pendant l'OCR) ; borné pour la mémoire
+OCR_MAX_WORKERS = min(8, os.cpu_count() or 1)
+_OCR_POOL: Optional[ThreadPoolExecutor] = None
+
 DB_PATH = "product_info_cleaned.csv"  # mets le bon chemin si besoin
 
 OCR_LANG = "eng+fra"
+# Modes PSM essayés par variante, texte épars (11) en premier : les suivants ne sont lancés
+# que tant qu'aucune extraction n'atteint EARLY_EXIT_SCORE (mêmes modes que la version d'origine)
 OCR_CONFIGS = [
-    r"--oem 3 --psm 6",
     r"--oem 3 --psm 11",
+    r"--oem 3 --psm 6",
     r"--oem 3 --psm 12",
     r"--oem 3 --psm 4",
     r"--oem 3 --psm 3",
 ]
 
+# Extraction jugée bonne (avg_conf >= 80 et grandes lignes >= 500 px) : variantes suivantes ignorées
+EARLY_EXIT_SCORE = 80 * 25 + 500
+
 INGREDIENT_MARKERS = ["INGREDIENTS", "INGRÉDIENTS", "INCI", "COMPOSITION", "CONTAINS"]
+_RE_INGREDIENT = re.compile("|".join(map(re.escape, INGREDIENT_MARKERS)), re.IGNORECASE)
 _RE_VOLUME = re.compile(r"\b\d+(\.\d+)?\s*(ML|FL\.?OZ|OZ|G|KG)\b", re.IGNORECASE)
 
 # mots qui ne sont PAS des marques (souvent le nom de gamme / descriptif)
@@ -40,6 +77,15 @@ GENERIC_NOT_BRAND = {
     "MELTING", "CLEANSE", "HAIR", "MILK", "LEAVE", "IN", "LEAVE-IN",
 }
 
+# candidats d'un seul mot qui ne peuvent pas identifier un produit : rejetés avant tout balayage DB.
+# En plus de GENERIC_NOT_BRAND : types de produit et zones du corps, fréquents dans les noms
+# du catalogue mais jamais nom complet d'un produit. Mots de moins de 4 lettres inutiles
+# (les candidats si courts sont déjà ignorés)
+NEVER_MATCH_SINGLE = GENERIC_NOT_BRAND | {
+    "TONER", "BALM", "FOAM", "SPRAY", "MIST", "SUNSCREEN", "SCRUB", "EXFOLIANT",
+    "FACE", "FACIAL", "BODY", "EYES", "LIPS", "SKIN", "SKINCARE", "TREATMENT", "WITH",
+}
+
 PRODUCT_HINTS = [
     "cleanser", "conditioner", "shampoo", "serum", "mask", "cream", "moisture",
     "anti aging", "anti-aging", "hydrating", "lotion", "spray", "milk", "toner",
@@ -75,11 +121,18 @@ def setup_tesseract() -> bool:
 # =========================================================
 # DB LOAD + NORMALIZATION
 # =========================================================
+_RE_TRADEMARK = re.compile(r"[®™©]")
+_RE_NON_ALNUM = re.compile(r"[^a-z0-9\s\-]")
+_RE_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=8192)
 def norm(s: str) -> str:
+    # Mémoïsé : les mêmes lignes OCR / candidats sont normalisés plusieurs fois par requête
     s = str(s or "").lower().strip()
-    s = re.sub(r"[®™©]", "", s)
-    s = re.sub(r"[^a-z0-9\s\-]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _RE_TRADEMARK.sub("", s)
+    s = _RE_NON_ALNUM.sub(" ", s)
+    s = _RE_SPACES.sub(" ", s).strip()
     return s
 
 
@@ -96,8 +149,10 @@ def safe_load_db(path: str) -> pd.DataFrame:
     df["product_name"] = df["product_name"].astype(str)
     df["brand_name"] = df["brand_name"].astype(str)
 
-    df["_pn"] = df["product_name"].apply(norm)
-    df["_bn"] = df["brand_name"].apply(norm)
+    # Noms DB normalisés une fois ici, sans passer par le cache (réservé aux textes OCR)
+    df["_pn"] = df["product_name"].apply(norm.__wrapped__)
+    df["_bn"] = df["brand_name"].apply(norm.__wrapped__)
+    df["_pn_len"] = df["_pn"].str.len()
 
     # optionnels
     if "price_usd" not in df.columns:
@@ -110,12 +165,52 @@ def safe_load_db(path: str) -> pd.DataFrame:
     return df
 
 
+def build_brand_index(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Marque normalisée -> positions des lignes (une entrée par marque distincte).
+    """
+    return {bn: np.asarray(pos, dtype=np.intp)
+            for bn, pos in df.groupby("_bn", sort=False).indices.items() if bn}
+
+
+@lru_cache(maxsize=1024)
+def brand_scope(brand_n: str) -> np.ndarray:
+    """
+    Lignes des marques dont le nom normalisé contient brand_n (sous-chaîne, comme un contains
+    sur la colonne) : le test porte sur les ~300 marques distinctes, pas sur chaque ligne.
+    Une marque lue partiellement ("revolution") couvre donc "revolution skincare".
+    """
+    hits = [rows for bn, rows in BRAND_INDEX.items() if brand_n in bn]
+    return np.sort(np.concatenate(hits)) if hits else np.empty(0, dtype=np.intp)
+
+
+def column_arrays(df: pd.DataFrame) -> Tuple[np.ndarray, ...]:
+    """
+    Instantané colonnes -> tableaux NumPy (SoA), indexés par position de ligne :
+    _pn, _bn, _pn_len, product_name, brand_name, rating, price_usd, primary_category.
+    """
+    return (
+        df["_pn"].to_numpy(),
+        df["_bn"].to_numpy(),
+        df["_pn_len"].to_numpy(),
+        df["product_name"].to_numpy(),
+        df["brand_name"].to_numpy(),
+        pd.to_numeric(df["rating"], errors="coerce").to_numpy(dtype=np.float64),
+        pd.to_numeric(df["price_usd"], errors="coerce").to_numpy(dtype=np.float64),
+        df["primary_category"].to_numpy(),
+    )
+
+
 # charge DB une seule fois
 try:
     DF = safe_load_db(DB_PATH)
+    BRAND_INDEX = build_brand_index(DF)
+    _PN, _BN, _PN_LEN, _PNAME, _BNAME, _RATING, _PRICE, _PCAT = column_arrays(DF)
     DB_READY = True
 except Exception as e:
     DF = pd.DataFrame()
+    BRAND_INDEX = {}
+    _PN = _BN = _PN_LEN = _PNAME = _BNAME = _RATING = _PRICE = _PCAT = np.empty(0)
     DB_READY = False
     DB_LOAD_ERROR = str(e)
 
@@ -123,18 +218,49 @@ except Exception as e:
 # =========================================================
 # OCR PREPROCESS
 # =========================================================
+def _contrast_cv2(gray: np.ndarray, factor: float) -> np.ndarray:
+    """ImageEnhance.Contrast : mean + factor * (px - mean), saturé en uint8."""
+    mean = int(cv2.mean(gray)[0] + 0.5)
+    return cv2.addWeighted(gray, factor, gray, 0.0, mean * (1.0 - factor))
+
+
+def _variants_cv2(img: Image.Image) -> List[Image.Image]:
+    """Mêmes variantes A/B/C que preprocess_variants, en OpenCV sur l'image L déjà redimensionnée."""
+    gray = np.asarray(img)
+
+    # A: sharpen (UnsharpMask radius=2, percent=190, threshold=3) + contrast
+    blurred = cv2.GaussianBlur(gray, (0, 0), 2)
+    a = cv2.addWeighted(gray, 2.9, blurred, -1.9, 0)
+    low_diff = cv2.absdiff(gray, blurred) < 3
+    a[low_diff] = gray[low_diff]
+    a = _contrast_cv2(a, 1.9)
+
+    # B: invert
+    b = cv2.bitwise_not(a)
+
+    # C: stronger contrast
+    c = _contrast_cv2(gray, 2.5)
+
+    return [Image.fromarray(a), Image.fromarray(b), Image.fromarray(c)]
+
+
 def preprocess_variants(image: Image.Image) -> List[Image.Image]:
     """
     Plusieurs variantes simples pour améliorer OCR.
     """
     variants = []
-    img = image.convert("L")
-
-    # resize stable (important)
     base_h = 1400
+
+    img = image if image.mode == "L" else image.convert("L")
+
+    # resize stable (important) : Lanczos pour agrandir, bilinéaire suffit pour réduire
     if img.height < 700 or img.height > 2400:
         ratio = base_h / float(img.height)
-        img = img.resize((int(img.width * ratio), base_h), Image.Resampling.LANCZOS)
+        resample = Image.Resampling.LANCZOS if img.height < base_h else Image.Resampling.BILINEAR
+        img = img.resize((int(img.width * ratio), base_h), resample)
+
+    if CV2_AVAILABLE:
+        return _variants_cv2(img)
 
     # A: sharpen + contrast
     a = img.filter(ImageFilter.UnsharpMask(radius=2, percent=190, threshold=3))
@@ -162,6 +288,13 @@ def rotate_variants(image: Image.Image) -> List[Tuple[str, Image.Image]]:
     ]
 
 
+def content_digest(img: Image.Image) -> Tuple:
+    """
+    Clé exacte d'une image (mode, taille, BLAKE2 des pixels) : égale seulement si pixels identiques.
+    """
+    return img.mode, img.size, hashlib.blake2b(img.tobytes(), digest_size=16).digest()
+
+
 def crop_zone(image: Image.Image, y0: float, y1: float) -> Image.Image:
     w, h = image.size
     return image.crop((0, int(h * y0), w, int(h * y1)))
@@ -177,55 +310,120 @@ def clean_token(t: str) -> str:
 # =========================================================
 # OCR -> LINES (word boxes -> grouped lines)
 # =========================================================
-def ocr_words(img: Image.Image, config: str, lang: str = OCR_LANG) -> List[Dict]:
-    data = pytesseract.image_to_data(
-        img,
-        config=config,
-        lang=lang,
-        output_type=pytesseract.Output.DICT
-    )
-    words = []
-    n = len(data.get("text", []))
-    for i in range(n):
-        txt = clean_token(data["text"][i])
-        if not txt:
+_RE_PSM = re.compile(r"--psm\s+(\d+)")
+_TESS_LOCAL = threading.local()
+
+
+def get_ocr_pool() -> ThreadPoolExecutor:
+    """Pool partagé entre requêtes : ses threads gardent leur handle tesserocr."""
+    global _OCR_POOL
+    if _OCR_POOL is None:
+        _OCR_POOL = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS)
+    return _OCR_POOL
+
+
+def _tess_api(lang: str):
+    """Handle PyTessBaseAPI du thread courant (l'API C n'est pas thread-safe), un par langue."""
+    apis = getattr(_TESS_LOCAL, "apis", None)
+    if apis is None:
+        apis = _TESS_LOCAL.apis = {}
+    if lang not in apis:
+        apis[lang] = tesserocr.PyTessBaseAPI(lang=lang)
+    return apis[lang]
+
+
+def _image_to_data_tesserocr(img: Image.Image, config: str, lang: str) -> Dict[str, List]:
+    """Même colonnes que pytesseract.image_to_data (text/conf/left/top/width/height)."""
+    api = _tess_api(lang)
+    m = _RE_PSM.search(config)
+    api.SetPageSegMode(int(m.group(1)) if m else tesserocr.PSM.AUTO)
+    api.SetImage(img)
+    api.Recognize()
+
+    data = {"text": [], "conf": [], "left": [], "top": [], "width": [], "height": []}
+    ri = api.GetIterator()
+    if ri is None:
+        return data
+    level = tesserocr.RIL.WORD
+    for r in tesserocr.iterate_level(ri, level):
+        text = r.GetUTF8Text(level)
+        box = r.BoundingBox(level)
+        if not text or box is None:
             continue
-        try:
-            conf = float(data["conf"][i])
-        except:
-            conf = -1.0
-        x, y, w, h = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
-        words.append({"text": txt, "conf": conf, "x": x, "y": y, "w": w, "h": h})
-    return words
+        x1, y1, x2, y2 = box
+        data["text"].append(text)
+        data["conf"].append(r.Confidence(level))
+        data["left"].append(x1)
+        data["top"].append(y1)
+        data["width"].append(x2 - x1)
+        data["height"].append(y2 - y1)
+    return data
 
 
-def group_words_into_lines(words: List[Dict], y_tol: int = 14) -> List[Dict]:
-    if not words:
+def _conf(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return -1.0
+
+
+def ocr_words(img: Image.Image, config: str, lang: str = OCR_LANG) -> Dict[str, np.ndarray]:
+    """
+    Mots OCR en colonnes (SoA) : text (object), conf (float32), x/y/w/h (int32).
+    """
+    if TESSEROCR_AVAILABLE:
+        data = _image_to_data_tesserocr(img, config, lang)
+    else:
+        data = pytesseract.image_to_data(
+            img,
+            config=config,
+            lang=lang,
+            output_type=pytesseract.Output.DICT
+        )
+    texts = [clean_token(t) for t in data.get("text", [])]
+    keep = [i for i, t in enumerate(texts) if t]
+    return {
+        "text": np.array([texts[i] for i in keep], dtype=object),
+        "conf": np.array([_conf(data["conf"][i]) for i in keep], dtype=np.float32),
+        "x": np.array([data["left"][i] for i in keep], dtype=np.int32),
+        "y": np.array([data["top"][i] for i in keep], dtype=np.int32),
+        "w": np.array([data["width"][i] for i in keep], dtype=np.int32),
+        "h": np.array([data["height"][i] for i in keep], dtype=np.int32),
+    }
+
+
+def group_words_into_lines(words: Dict[str, np.ndarray], y_tol: int = 14) -> List[Dict]:
+    n = words["text"].size
+    if n == 0:
         return []
-    words = sorted(words, key=lambda d: (d["y"], d["x"]))
 
-    groups = []
-    cur = [words[0]]
-    for w in words[1:]:
-        if abs(w["y"] - cur[-1]["y"]) <= y_tol:
-            cur.append(w)
-        else:
-            groups.append(cur)
-            cur = [w]
-    groups.append(cur)
+    # tri (y, x) puis coupure dès que l'écart vertical entre mots consécutifs dépasse y_tol
+    order = np.lexsort((words["x"], words["y"]))
+    breaks = np.flatnonzero(np.diff(words["y"][order]) > y_tol) + 1
+    starts = np.concatenate(([0], breaks))
+    group_id = np.zeros(n, dtype=np.intp)
+    group_id[breaks] = 1
+    group_id = np.cumsum(group_id)
+
+    # dans chaque groupe : ordre gauche -> droite (tri stable)
+    order = order[np.lexsort((words["x"][order], group_id))]
+    text = words["text"][order]
+    conf = words["conf"][order]
+    valid = conf >= 0
+    conf_sum = np.add.reduceat(np.where(valid, conf, 0.0), starts)
+    conf_cnt = np.add.reduceat(valid.astype(np.int32), starts)
+    avg_conf = np.divide(conf_sum, conf_cnt, out=np.zeros(len(starts)), where=conf_cnt > 0)
+    max_h = np.maximum.reduceat(words["h"][order], starts)
+    min_y = np.minimum.reduceat(words["y"][order], starts)
+    min_x = np.minimum.reduceat(words["x"][order], starts)
 
     lines = []
-    for g in groups:
-        g = sorted(g, key=lambda d: d["x"])
-        text = " ".join(w["text"] for w in g).strip()
-        if not text:
+    for g, (a, b) in enumerate(zip(starts, np.append(starts[1:], n))):
+        line_text = " ".join(text[a:b]).strip()
+        if not line_text:
             continue
-        confs = [w["conf"] for w in g if w["conf"] >= 0]
-        avg_conf = sum(confs) / len(confs) if confs else 0.0
-        max_h = max(w["h"] for w in g)
-        min_y = min(w["y"] for w in g)
-        min_x = min(w["x"] for w in g)
-        lines.append({"text": text, "avg_conf": avg_conf, "max_h": max_h, "y": min_y, "x": min_x})
+        lines.append({"text": line_text, "avg_conf": float(avg_conf[g]), "max_h": int(max_h[g]),
+                      "y": int(min_y[g]), "x": int(min_x[g])})
 
     # merge lines very close in y
     lines = sorted(lines, key=lambda d: (d["y"], d["x"]))
@@ -242,52 +440,86 @@ def group_words_into_lines(words: List[Dict], y_tol: int = 14) -> List[Dict]:
 
 
 def has_ingredient_marker(t: str) -> bool:
-    U = norm(t).upper()
-    return any(m in U for m in INGREDIENT_MARKERS)
+    # une seule passe regex (alternation compilée) au lieu d'un `in` par marqueur
+    return _RE_INGREDIENT.search(norm(t)) is not None
 
 
 def is_noise_line(t: str) -> bool:
     U = t.strip()
     if len(U) < 2:
         return True
-    if _RE_VOLUME.search(U.upper()):
+    if _RE_VOLUME.search(U):
         return True
     if not any(c.isalpha() for c in U):
         return True
     return False
 
 
-def ocr_lines_multi(img: Image.Image) -> List[Dict]:
+def score_ocr_lines(lines: List[Dict], img_height: int) -> float:
     """
-    OCR robuste: variantes + configs -> garde la meilleure extraction.
+    Note d'une extraction : confiance moyenne, taille des plus grandes lignes, malus si
+    un marqueur d'ingrédients apparaît en haut de l'image.
+    """
+    avg_conf = sum(l["avg_conf"] for l in lines) / max(1, len(lines))
+    top_sizes = sum(sorted([l["max_h"] for l in lines], reverse=True)[:6])
+    early_ing = any(has_ingredient_marker(l["text"]) and l["y"] < img_height * 0.35 for l in lines)
+    return avg_conf * 25 + top_sizes - (150 if early_ing else 0)
+
+
+def best_ocr_lines(word_lists: Iterable[List[Dict]], img_height: int) -> List[Dict]:
+    """
+    Parmi les extractions (variantes x configs, dans l'ordre), garde la mieux notée.
+    Arrêt dès qu'une extraction dépasse EARLY_EXIT_SCORE (les suivantes ne sont pas consommées).
     """
     best_lines = []
     best_score = -1e18
 
-    for v in preprocess_variants(img):
-        for cfg in OCR_CONFIGS:
-            words = ocr_words(v, cfg)
-            lines = group_words_into_lines(words)
-            if not lines:
-                continue
+    for words in word_lists:
+        lines = group_words_into_lines(words)
+        if not lines:
+            continue
 
-            avg_conf = sum(l["avg_conf"] for l in lines) / max(1, len(lines))
-            top_sizes = sum(sorted([l["max_h"] for l in lines], reverse=True)[:6])
-            early_ing = any(has_ingredient_marker(l["text"]) and l["y"] < img.height * 0.35 for l in lines)
+        score = score_ocr_lines(lines, img_height)
 
-            score = avg_conf * 25 + top_sizes - (150 if early_ing else 0)
+        if score > EARLY_EXIT_SCORE:
+            return lines
 
-            if score > best_score:
-                best_score = score
-                best_lines = lines
+        if score > best_score:
+            best_score = score
+            best_lines = lines
 
     return best_lines
 
 
+def ocr_variant(img: Image.Image) -> List[List[Dict]]:
+    """
+    Modes OCR_CONFIGS dans l'ordre ; arrêt dès qu'une extraction dépasse EARLY_EXIT_SCORE.
+    """
+    results = []
+    for config in OCR_CONFIGS:
+        words = ocr_words(img, config)
+        results.append(words)
+        lines = group_words_into_lines(words)
+        if lines and score_ocr_lines(lines, img.height) > EARLY_EXIT_SCORE:
+            break
+    return results
+
+
+def ocr_lines_multi(img: Image.Image) -> List[Dict]:
+    """
+    OCR robuste: variantes + configs -> garde la meilleure extraction.
+    """
+    word_lists = (words for v in preprocess_variants(img) for words in ocr_variant(v))
+    return best_ocr_lines(word_lists, img.height)
+
+
 # =========================================================
 # BUILD PRODUCT CANDIDATES FROM OCR LINES
 # =========================================================
-def build_candidates(lines: List[str]) -> List[str]:
+def build_candidates(lines: List[str]) -> List[Tuple[str, str, frozenset]]:
+    """
+    Candidats (1..3 lignes consécutives), normalisés une seule fois : (brut, normalisé, tokens).
+    """
     lines = [l.strip() for l in lines if l and len(l.strip()) >= 3]
 
     cands = []
@@ -305,7 +537,7 @@ def build_candidates(lines: List[str]) -> List[str]:
         k = norm(c)
         if k and k not in seen and len(k) > 4:
             seen.add(k)
-            out.append(c)
+            out.append((c, k, frozenset(k.split())))
     return out
 
 
@@ -316,7 +548,10 @@ def sim(a: str, b: str) -> float:
 
 
 def hint_bonus(text: str) -> float:
-    t = norm(text)
+    return hint_bonus_from_norm(norm(text))
+
+
+def hint_bonus_from_norm(t: str) -> float:
     bonus = 0.0
     for h in PRODUCT_HINTS:
         if h in t:
@@ -369,12 +604,28 @@ def guess_brand_from_lines(lines: List[str]) -> str:
     return best if best else "Unknown"
 
 
-def find_best_product(ocr_lines: List[str], brand_guess: str = "", min_score: float = 0.68) -> Dict:
+def is_never_match_single(cand_n: str, cand_toks: frozenset) -> bool:
+    """
+    Candidat d'un seul mot générique (cf. NEVER_MATCH_SINGLE) : ne peut pas identifier un produit.
+
+    >>> is_never_match_single("toner", frozenset({"toner"}))
+    True
+    >>> is_never_match_single("euphoria", frozenset({"euphoria"}))
+    False
+    >>> is_never_match_single("glow toner", frozenset({"glow", "toner"}))
+    False
+    """
+    return len(cand_toks) == 1 and cand_n.upper() in NEVER_MATCH_SINGLE
+
+
+def find_best_product(ocr_lines: List[str], brand_guess: str = "", min_score: float = 0.68,
+                      sim_cache: Optional[Dict] = None) -> Dict:
     """
     Match DB:
     - candidates (1..3 lines combos)
     - filtre par brand si possible
     - score = product_sim + brand_bonus + hint_bonus
+    - sim_cache: ratios (cand_n, ligne DB) partagés entre appels d'une même requête
     """
     if not DB_READY:
         return {
@@ -385,11 +636,16 @@ def find_best_product(ocr_lines: List[str], brand_guess: str = "", min_score: fl
     candidates = build_candidates(ocr_lines)
     brand_n = norm(brand_guess)
 
-    df = DF
+    # positions des lignes DB à scorer (toutes, ou celles de la marque devinée)
+    scope = None
     if brand_n and len(brand_n) >= 3:
-        sub = DF[DF["_bn"].str.contains(brand_n, na=False)]
-        if not sub.empty:
-            df = sub
+        # toutes les marques contenant la marque devinée (lecture partielle incluse)
+        idxs = brand_scope(brand_n)
+        if idxs.size:
+            scope = idxs
+    if scope is None:
+        scope = np.arange(_PN.size)
+    scope_len = _PN_LEN[scope]
 
     best = None
 
@@ -397,38 +653,71 @@ def find_best_product(ocr_lines: List[str], brand_guess: str = "", min_score: fl
     if not candidates:
         return {"found": False, "message": "No OCR candidates"}
 
-    for cand in candidates:
-        cand_n = norm(cand)
+    # Accès colonne : tableaux NumPy du chargement, indexés par position (pas de Series par ligne)
+    best_pos = -1
+    if sim_cache is None:
+        sim_cache = {}
+
+    # SequenceMatcher réutilisés : la table b2j est construite sur seq2, donc seq2 reste
+    # fixe (candidat / marque) et seule seq1 change à chaque ligne. autojunk désactivé.
+    sm = SequenceMatcher(None, autojunk=False)
+    sm_b = SequenceMatcher(None, autojunk=False)
+    if brand_n:
+        sm_b.set_seq2(brand_n)
+
+    for cand, cand_n, cand_toks in candidates:
         if len(cand_n) < 4:
             continue
 
         # petit filtre: si le cand est juste 1 mot très générique -> on ignore
-        if len(cand_n.split()) == 1 and cand_n.upper() in GENERIC_NOT_BRAND:
+        if is_never_match_single(cand_n, cand_toks):
             continue
 
-        for _, row in df.iterrows():
-            base = sim(cand_n, row["_pn"])
+        # Préfiltre exact avant SequenceMatcher : ratio <= 2*min(la, lb)/(la+lb),
+        # donc base >= 0.40 impose la/4 <= lb <= 4*la
+        la = len(cand_n)
+        rows = scope[(scope_len * 4 >= la) & (scope_len <= la * 4)]
+
+        # Présélection en C (rapidfuzz) : fuzz.ratio (LCS) majore le ratio SequenceMatcher,
+        # le seuil 40 n'écarte donc aucune ligne capable d'atteindre base >= 0.40
+        if RAPIDFUZZ_AVAILABLE and rows.size > FUZZY_SHORTLIST:
+            hits = process.extract(cand_n, _PN[rows], scorer=fuzz.ratio,
+                                   score_cutoff=40, limit=FUZZY_SHORTLIST)
+            rows = rows[[hit[2] for hit in hits]]
+
+        h = hint_bonus_from_norm(cand_n)
+        sm.set_seq2(cand_n)
+        for pos in rows:
+            key = (cand_n, pos)
+            base = sim_cache.get(key)
+            if base is None:
+                sm.set_seq1(_PN[pos])
+                base = sm.ratio()
+                sim_cache[key] = base
             if base < 0.40:
                 continue
 
             brand_bonus = 0.0
             if brand_n:
-                brand_bonus = 0.15 * sim(brand_n, row["_bn"])
+                sm_b.set_seq1(_BN[pos])
+                brand_bonus = 0.15 * sm_b.ratio()
 
-            h = hint_bonus(cand)
             score = base + brand_bonus + h
 
             if (best is None) or (score > best["match_score"]):
-                best = {
-                    "found": True,
-                    "match_score": score,
-                    "used_candidate": cand,
-                    "product_name": row["product_name"],
-                    "brand_name": row["brand_name"],
-                    "rating": float(row["rating"]) if pd.notnull(row["rating"]) else None,
-                    "price_usd": float(row["price_usd"]) if pd.notnull(row["price_usd"]) else None,
-                    "primary_category": row.get("primary_category", ""),
-                }
+                best = {"found": True, "match_score": score, "used_candidate": cand}
+                best_pos = pos
+
+    # Seule la ligne retenue est matérialisée
+    if best is not None:
+        rating, price = _RATING[best_pos], _PRICE[best_pos]
+        best.update({
+            "product_name": _PNAME[best_pos],
+            "brand_name": _BNAME[best_pos],
+            "rating": float(rating) if not np.isnan(rating) else None,
+            "price_usd": float(price) if not np.isnan(price) else None,
+            "primary_category": _PCAT[best_pos],
+        })
 
     if not best or best["match_score"] < min_score:
         return {
@@ -441,6 +730,75 @@ def find_best_product(ocr_lines: List[str], brand_guess: str = "", min_score: fl
     return best
 
 
+# =========================================================
+# OCR GRID (rotations x zones)
+# =========================================================
+# zones importantes : top / mid / bottom ; full en repli
+OCR_ZONES = {
+    "top": (0.0, 0.40),
+    "mid": (0.20, 0.80),
+    "bottom": (0.55, 1.0),
+}
+OCR_FALLBACK_ZONES = {"full": (0.0, 1.0)}
+OCR_MIN_UNIQUE_LINES = 3
+
+
+def ocr_zone_lines(image: Image.Image, zones: Dict[str, Tuple[float, float]],
+                   debug_lines: Optional[List] = None) -> List[str]:
+    """
+    Lignes texte filtrées de chaque (rotation, zone), dans l'ordre rotations puis zones.
+    """
+    # Toute la grille rotations x zones x variantes part dans le pool ;
+    # regroupement et notation se font ensuite ici, dans l'ordre d'origine
+    # Variantes identiques au pixel près : un seul appel Tesseract, résultat partagé
+    jobs = []
+    pool = get_ocr_pool()
+    submitted: Dict[Tuple, Future] = {}
+    for rot_name, rot_img in rotate_variants(image):
+        for zn, (y0, y1) in zones.items():
+            crop = crop_zone(rot_img, y0, y1)
+            futures = []
+            for v in preprocess_variants(crop):
+                key = content_digest(v)
+                if key not in submitted:
+                    submitted[key] = pool.submit(ocr_variant, v)
+                futures.append(submitted[key])
+            jobs.append((rot_name, zn, crop.height, futures))
+    pending = Counter(f for _, _, _, futures in jobs for f in futures)
+
+    collected_lines: List[str] = []
+    for rot_name, zn, crop_h, futures in jobs:
+        lines = best_ocr_lines((words for f in futures for words in f.result()), crop_h)
+        # sortie anticipée : variantes pas encore lancées et non partagées avec une zone suivante -> annulées
+        pending.subtract(futures)
+        for f in futures:
+            if pending[f] <= 0:
+                f.cancel()
+
+        # garder seulement textes
+        texts = [l["text"] for l in lines if l.get("text")]
+        # filtrage léger
+        texts = [t for t in texts if not is_noise_line(t) and not has_ingredient_marker(t)]
+
+        collected_lines.extend(texts)
+
+        if debug_lines is not None:
+            debug_lines.append((rot_name, zn, texts[:12]))
+
+    return collected_lines
+
+
+def dedupe_lines(lines: List[str]) -> List[str]:
+    seen = set()
+    uniq_lines = []
+    for t in lines:
+        k = norm(t)
+        if k and k not in seen:
+            seen.add(k)
+            uniq_lines.append(t)
+    return uniq_lines
+
+
 # =========================================================
 # MAIN PUBLIC FUNCTION (FastAPI uses this)
 # =========================================================
@@ -453,51 +811,28 @@ def extract_product_info_enhanced(image: Image.Image, debug_mode: bool = False)
     - price_usd
     - match_score
     """
-    if not TESSERACT_AVAILABLE:
+    if not (TESSERACT_AVAILABLE or TESSEROCR_AVAILABLE):
         return {"success": False, "error": "pytesseract non installé", "brand": "", "product_name": "", "ingredients": ""}
 
-    if not setup_tesseract():
+    if not TESSEROCR_AVAILABLE and not setup_tesseract():
         return {"success": False, "error": "Tesseract introuvable", "brand": "", "product_name": "", "ingredients": ""}
 
     if not DB_READY:
         return {"success": False, "error": f"DB not ready: {globals().get('DB_LOAD_ERROR','unknown')}", "brand": "", "product_name": "", "ingredients": ""}
 
     try:
-        # zones importantes : top / mid / bottom / full
-        zones = {
-            "top": (0.0, 0.40),
-            "mid": (0.20, 0.80),
-            "bottom": (0.55, 1.0),
-            "full": (0.0, 1.0),
-        }
+        # niveaux de gris une seule fois : rotations et crops travaillent sur 1 octet/pixel
+        image = image.convert("L")
 
         # OCR collect lines from all crops + rotations
-        collected_lines: List[str] = []
-        debug_lines = []
-
-        for rot_name, rot_img in rotate_variants(image):
-            for zn, (y0, y1) in zones.items():
-                crop = crop_zone(rot_img, y0, y1)
-                lines = ocr_lines_multi(crop)
-
-                # garder seulement textes
-                texts = [l["text"] for l in lines if l.get("text")]
-                # filtrage léger
-                texts = [t for t in texts if not is_noise_line(t) and not has_ingredient_marker(t)]
-
-                collected_lines.extend(texts)
-
-                if debug_mode:
-                    debug_lines.append((rot_name, zn, texts[:12]))
+        debug_lines = [] if debug_mode else None
+        collected_lines = ocr_zone_lines(image, OCR_ZONES, debug_lines)
+        uniq_lines = dedupe_lines(collected_lines)
 
-        # dedupe lines
-        seen = set()
-        uniq_lines = []
-        for t in collected_lines:
-            k = norm(t)
-            if k and k not in seen:
-                seen.add(k)
-                uniq_lines.append(t)
+        # zone "full" seulement si top / mid / bottom (qui la couvrent déjà) donnent trop peu
+        if len(uniq_lines) < OCR_MIN_UNIQUE_LINES:
+            collected_lines += ocr_zone_lines(image, OCR_FALLBACK_ZONES, debug_lines)
+            uniq_lines = dedupe_lines(collected_lines)
 
         if not uniq_lines:
             return {"success": False, "error": "Aucun texte détecté", "brand": "", "product_name": "", "ingredients": ""}
@@ -505,12 +840,13 @@ def extract_product_info_enhanced(image: Image.Image, debug_mode: bool = False)
         # 1) guess brand (optional)
         brand_guess = guess_brand_from_lines(uniq_lines)
 
-        # 2) match DB to find product + rating
-        match = find_best_product(uniq_lines, brand_guess=brand_guess, min_score=0.68)
+        # 2) match DB to find product + rating (ratios partagés avec le repli)
+        sim_cache: Dict = {}
+        match = find_best_product(uniq_lines, brand_guess=brand_guess, min_score=0.68, sim_cache=sim_cache)
 
         if not match.get("found"):
             # fallback: essayer sans brand
-            match2 = find_best_product(uniq_lines, brand_guess="", min_score=0.70)
+            match2 = find_best_product(uniq_lines, brand_guess="", min_score=0.70, sim_cache=sim_cache)
             match = match2 if match2.get("found") else match
 
         if match.get("found"):